@@ -1,97 +1,367 @@
 #!/usr/bin/env python
 import os, sys, argparse
-import math
+import numpy as np
+from kreport_levels import read_kreport as read_tree, load_tree
+
+# alpha diversity types, in output order: [type, column name]
+ALPHAS = [['Sh', "Shannon's diversity"],
+	['BP', "Berger-parker's diversity"],
+	['Si', "Simpson's index of diversity"],
+	['ISi', "Simpson's Reciprocal Index"],
+	['F', "Fisher's index"],
+	['Chao1', "Chao1 richness"],
+	['ACE', "ACE richness"],
+	['Ev', "Pielou's evenness"]]
+
+# all alpha diversities are calculated for a samples x species matrix
+# of abundances (n), one sample per row
 
 def shannons_alpha(p):
 	# shannons = -sum(pi ln(pi))
-	h = []
-	for i in p:
-		h.append(i * math.log(i))
-	print("Shannon's diversity: %s" %(-1 *sum(h)))
-	return (-1 *sum(h))
+	return -1 * np.sum(p * np.log(np.where(p > 0, p, 1)), axis=1)
 
 def berger_parkers_alpha(p):
 	# bp is nmax/N which is equal to the max pi == max(p)
-	print("Berger-parker's diversity: %s" %max(p))
-	return max(p)
+	return np.max(p, axis=1)
 
 def simpsons_alpha(D):
 	# simpsons index of diversity = 1 - D
 	# D = (sum ni(ni-1))/ N*(N-1)
-	print("Simpson's index of diversity: %s" %(1-D))
 	return 1-D
 
 def inverse_simpsons_alpha(D):
 	# simsons inverse = 1/D
-	print("Simpson's Reciprocal Index: %s" %(1/D))
 	return 1/D
 
-def fishers_alpha():	
-	global np
-	import numpy as np
-	from scipy.optimize import fsolve
-	
-	fish = fsolve(eqn_output,1)
-	
+def fishers_alpha(N, S, iterations=100):
+	# fishers alpha (a) solves S = a * ln(1 + N/a)
+	# solved by newton's method for each value of N and S (numpy arrays) at once
+	N = np.asarray(N, dtype=float)
+	S = np.asarray(S, dtype=float)
+	# no solution exists if S >= N (a -> infinity) or S == 0
+	solved = (S > 0) & (S < N)
+	unsolved = np.where(S > 0, np.inf, np.nan)
+	N = np.where(solved, N, 2.0)
+	S = np.where(solved, S, 1.0)
+	# f(a) = a ln(1 + N/a) - S is increasing and concave, so newton's method
+	# converges from any a < solution; steps to a <= 0 are replaced by a/10
+	a = np.array(S)
+	for i in range(iterations):
+		log_term = np.log1p(N/a)
+		f = a * log_term - S
+		df = log_term - N/(a + N)
+		next_a = a - f/df
+		next_a = np.where(next_a > 0, next_a, a/10)
+		if np.all(np.abs(next_a - a) <= 1e-12 * a):
+			a = next_a
+			break
+		a = next_a
 	# NOTE:
 	# if ratio of N/S > 20 then x > 0.99 (Poole,1974)
 	# x is almost always > 0.9 and never > 1.0 i.e. ~ 0.9 < x < 1.0
-	print("Fisher's index: %s" %fish[0])
-	return fish
+	return np.where(solved, a, unsolved)
+
+def chao1_alpha(n, S):
+	# chao1 = S + F1(F1-1)/(2(F2+1)) (bias-corrected)
+	# F1, F2 = number of species with 1 or 2 reads
+	F1 = np.sum(n == 1, axis=1)
+	F2 = np.sum(n == 2, axis=1)
+	return S + F1*(F1-1)/(2.0*(F2+1))
+
+def ace_alpha(n, S, rare=10):
+	# ace = S_abund + S_rare/C + F1/C * gamma^2
+	# rare species have <= 10 reads; C = 1 - F1/N_rare (sample coverage)
+	# gamma^2 = max(S_rare/C * sum(i(i-1)Fi)/(N_rare(N_rare-1)) - 1, 0)
+	is_rare = (n > 0) & (n <= rare)
+	S_rare = np.sum(is_rare, axis=1)
+	S_abund = S - S_rare
+	N_rare = np.sum(np.where(is_rare, n, 0), axis=1)
+	F1 = np.sum(n == 1, axis=1)
+	C = 1 - F1/np.where(S_rare > 0, N_rare, 1)
+	# undefined if all rare species have 1 read (C == 0)
+	C = np.where(C > 0, C, np.nan)
+	sum_rare = np.sum(np.where(is_rare, n*(n-1), 0), axis=1)
+	gamma = S_rare/C * sum_rare/np.where(N_rare > 1, N_rare*(N_rare-1), 1) - 1
+	gamma = np.maximum(gamma, 0)
+	ace = S_abund + S_rare/C + F1/C*gamma
+	return np.where(S_rare > 0, ace, S_abund)
+
+def evenness_alpha(H, S):
+	# pielous evenness = H / ln(S)
+	return H/np.log(S)
+
+def alpha_diversity(n):
+	# calculates all alpha diversities for each row of a samples x species
+	# matrix of abundances (or a vector of abundances for one sample)
+	n = np.atleast_2d(np.asarray(n, dtype=float))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		N = np.sum(n, axis=1) # total number of individuals
+		S = np.sum(n > 0, axis=1) # total number of species (ignoring zeros)
+		p = n/N[:,None] # pi is the ni/N
+		D = np.sum(n*(n-1), axis=1)/(N*(N-1))
+		H = shannons_alpha(p)
+		return {'Sh':H,
+			'BP':berger_parkers_alpha(p),
+			'Si':simpsons_alpha(D),
+			'ISi':inverse_simpsons_alpha(D),
+			'F':fishers_alpha(N, S),
+			'Chao1':chao1_alpha(n, S),
+			'ACE':ace_alpha(n, S),
+			'Ev':evenness_alpha(H, S)}
+
+def rarefaction(n, depths, iterations=10, seed=0):
+	# subsamples each sample (row of n) without replacement to each depth
+	# (multivariate hypergeometric draws, all iterations at once) and
+	# calculates all alpha diversities of all subsamples of a sample at once
+	# (one depths*iterations x species matrix)
+	# returns [mean, standard deviation] of each alpha diversity and the mean
+	# number of observed species, each as a samples x depths matrix 
+	# (NaN for depths larger than the sample)
+	n = np.rint(np.atleast_2d(n)).astype(np.int64)
+	rng = np.random.default_rng(seed)
+	means = dict([[alpha[0], np.full((n.shape[0], len(depths)), np.nan)] for alpha in ALPHAS])
+	sds = dict([[alpha[0], np.full((n.shape[0], len(depths)), np.nan)] for alpha in ALPHAS])
+	observed = np.full((n.shape[0], len(depths)), np.nan)
+	ddof = 1 if iterations > 1 else 0
+	for i in range(n.shape[0]):
+		# only species found in the sample can be drawn 
+		colors = n[i][n[i] > 0]
+		cols = [j for j in range(len(depths)) if depths[j] <= np.sum(colors)]
+		if len(cols) == 0:
+			continue
+		subsamples = np.vstack([rng.multivariate_hypergeometric(colors, depths[j], size=iterations) for j in cols])
+		values = alpha_diversity(subsamples)
+		# diversities may be inf/NaN at small depths (e.g. Fisher's alpha), 
+		# giving inf/NaN means and standard deviations
+		with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+			for alpha in ALPHAS:
+				depth_values = values[alpha[0]].reshape(len(cols), iterations)
+				means[alpha[0]][i,cols] = np.mean(depth_values, axis=1)
+				sds[alpha[0]][i,cols] = np.std(depth_values, axis=1, ddof=ddof)
+		observed[i,cols] = np.mean(np.sum(subsamples > 0, axis=1).reshape(len(cols), iterations), axis=1)
+	return [means, sds, observed]
 
-def eqn_output(a):
-	return a * np.log(1+N_f/a) - S_f
+# each reader returns [sample names, taxa, taxa x samples abundances]
+# lines (e.g. from another program, in memory) can be given instead of 
+# reading the file, with the filename only used to name the sample[s]
+def open_lines(filename, lines):
+	if lines is None:
+		return open(filename)
+	return iter(lines)
+
+def read_bracken(filename, lines=None):
+	# read the abundance estimate of each species (skipping the header line)
+	f = open_lines(filename, lines)
+	next(f)
+	taxa = []
+	n = []
+	for line in f:
+		l_vals = line.split('\t')
+		taxa.append(l_vals[1])
+		n.append(l_vals[5]) # finds the abundance estimate
+	if lines is None:
+		f.close()
+	return [[filename], taxa, np.array(n, dtype=float).reshape(-1,1)]
+
+def read_kreport(filename, level, lines=None):
+	# read the clade reads of each taxon at the given level
+	# (from the report's tree of taxa, see kreport_levels.py)
+	if lines is None:
+		tree = load_tree(filename, 'kreport')
+	else:
+		tree = read_tree(lines)
+	[taxa, n] = tree.level_counts(level)
+	return [[filename], taxa, n.reshape(-1,1)]
+
+def read_combined(filename, level, lines=None):
+	# read the clade reads of each taxon at the given level for each 
+	# sample of a combine_kreports.py report
+	# (reports with --only-combined are read as one sample of the total
+	# reads; samples of reports with --no-headers are named by column)
+	f = open_lines(filename, lines)
+	names = []
+	taxa = []
+	n = []
+	width = -1
+	for line in f:
+		l_vals = line.strip().split('\t')
+		if l_vals[0] == '#perc':
+			names = [name[:-4] for name in l_vals[3:-3:2]]
+		elif line[0] != '#' and len(l_vals) >= 6:
+			cols = l_vals[3:-3:2]
+			if len(cols) == 0:
+				cols = l_vals[1:2]
+			width = len(cols)
+			if l_vals[-3] == level:
+				taxa.append(l_vals[-2])
+				n.append(cols)
+	if lines is None:
+		f.close()
+	if width == -1:
+		sys.stderr.write("ERROR: no taxa found in combined report %s\n" % filename)
+		sys.exit(1)
+	if width == 1 and len(names) == 0:
+		names = [filename]
+	elif width > 0 and len(names) != width:
+		names = [filename + ':' + str(i+1) for i in range(width)]
+	return [names, taxa, np.array(n, dtype=float).reshape(-1,len(names))]
+
+def read_mpa(filename, level, lines=None):
+	# read the values of each classification at the given level for each 
+	# sample of a kreport2mpa.py/combine_mpa.py file
+	f = open_lines(filename, lines)
+	names = []
+	taxa = []
+	n = []
+	for line in f:
+		l_vals = line.strip().split('\t')
+		if line[0] == '#':
+			names = l_vals[1:]
+		elif l_vals[0].rsplit('|', 1)[-1].startswith(level.lower() + '__'):
+			taxa.append(l_vals[0])
+			n.append(l_vals[1:])
+	if lines is None:
+		f.close()
+	if len(names) == 0:
+		names = [filename]
+		if len(n) > 0 and len(n[0]) > 1:
+			names = [filename + ':' + str(i+1) for i in range(len(n[0]))]
+	return [names, taxa, np.array(n, dtype=float).reshape(-1,len(names))]
+
+def read_samples(filenames, filetype, level, inputs=None):
+	# reads all input files (or the lines of each input, if given) 
+	# into one samples x taxa matrix of abundances
+	# returns [sample names, taxa, samples x taxa abundances]
+	return read_levels(filenames, filetype, [level], inputs)[0]
+
+def read_levels(filenames, filetype, levels, inputs=None):
+	# reads all input files (or the lines of each input, if given) into one
+	# samples x taxa matrix of abundances for each level. Each file is read
+	# once for all levels (kraken reports are parsed once into a tree of taxa),
+	# one file at a time
+	# returns [sample names, taxa, samples x taxa abundances] for each level
+	names = [[] for level in levels]
+	taxa = [{} for level in levels]
+	samples = [[] for level in levels]
+	if inputs is None:
+		inputs = [None]*len(filenames)
+	for [filename, lines] in zip(filenames, inputs):
+		if filetype == 'kreport':
+			if lines is None:
+				tree = load_tree(filename, 'kreport')
+			else:
+				tree = read_tree(lines)
+		elif filetype != 'bracken' and lines is None and len(levels) > 1:
+			f = open(filename)
+			lines = f.readlines()
+			f.close()
+		for [l, level] in enumerate(levels):
+			if filetype == 'bracken':
+				[f_names, f_taxa, f_n] = read_bracken(filename, lines)
+			elif filetype == 'kreport':
+				[f_taxa, f_n] = tree.level_counts(level)
+				[f_names, f_n] = [[filename], f_n.reshape(-1,1)]
+			elif filetype == 'combined':
+				[f_names, f_taxa, f_n] = read_combined(filename, level, lines)
+			else:
+				[f_names, f_taxa, f_n] = read_mpa(filename, level, lines)
+			cols = np.array([taxa[l].setdefault(taxon, len(taxa[l])) for taxon in f_taxa], dtype=np.int64)
+			names[l] += f_names
+			samples[l].append([cols, f_n])
+	levels_n = []
+	for l in range(len(levels)):
+		n = np.zeros((len(names[l]), len(taxa[l])))
+		row = 0
+		for [cols, f_n] in samples[l]:
+			# np.add.at sums any repeated taxa 
+			for i in range(f_n.shape[1]):
+				np.add.at(n[row], cols, f_n[:,i])
+				row += 1
+		levels_n.append([names[l], list(taxa[l]), n])
+	return levels_n
 
 # Main method
-def main():
+def main(argv=None):
 	# get arguments
-	parser = argparse.ArgumentParser(description='Pick an alpha diversity.')
-	parser.add_argument('-f','--filename',dest='filename',help='bracken file with species abundance estimates')
-	parser.add_argument('-a','--alpha',dest='value',default='Sh',type=str,  help='type of alpha diversity to calculate Sh, BP, Si, ISi, F, default = Sh')
-	args = parser.parse_args()
-
-	f = open(args.filename)
-	
-	f.readline()
+	parser = argparse.ArgumentParser(description='Calculate alpha diversities.')
+	parser.add_argument('-f','--filename','--filenames',dest='filenames',required=True,nargs='+',
+		help='bracken file[s] with species abundance estimates (or files of --type)')
+	parser.add_argument('-a','--alpha',dest='values',default=['all'],nargs='+',type=str,
+		choices=['all'] + [alpha[0] for alpha in ALPHAS],
+		help='type[s] of alpha diversity to calculate Sh, BP, Si, ISi, F, Chao1, ACE, Ev, default = all')
+	parser.add_argument('-t','--type',dest='filetype',default='bracken',
+		choices=['bracken','kreport','combined','mpa'],
+		help='type of input files: bracken outputs, kraken reports, combine_kreports.py reports or kreport2mpa.py/combine_mpa.py files, default = bracken')
+	parser.add_argument('-l','--level',dest='levels',default=['S'],nargs='+',type=str,
+		help='level[s] of taxa to use for kreport, combined or mpa input files (S, G, F, etc), default = S')
+	parser.add_argument('-o','--output',dest='out_file',default='',
+		help='output tab-delimited file, default = print to screen')
+	parser.add_argument('-r','--rarefy',dest='depths',default=[],nargs='+',type=int,
+		help='subsample each sample to these depth[s] (number of reads) and print the mean/sd of each alpha diversity per depth')
+	parser.add_argument('--iterations',dest='iterations',default=10,type=int,
+		help='number of subsamples per sample and depth, default = 10')
+	parser.add_argument('--seed',dest='seed',default=0,type=int,
+		help='random seed for subsampling, default = 0')
+	parser.add_argument('--curve',dest='curve_file',default='',
+		help='output rarefaction curve file (mean observed species per depth for each sample)')
+	args = parser.parse_args(argv)
+
+	# read in the files (each file is read once for all levels)
+	if args.filetype == 'bracken':
+		args.levels = args.levels[0:1]
+	names = []
+	labels = []
 	n = []
-	# read in the file
-	for line in f: 
-		ind_abund = line.split('\t')[5] # finds the abundance estimate
-		n.append(float(ind_abund)) 
-	
-	f.close()
-	
+	levels_n = read_levels(args.filenames, args.filetype, args.levels)
+	for [level, [level_names, level_taxa, level_n]] in zip(args.levels, levels_n):
+		names += level_names
+		n.append(level_n)
+		if len(args.levels) > 1:
+			labels += [name + "\t" + level for name in level_names]
+	# one row per sample (and level); taxa of different levels are in separate
+	# rows, so rows are only padded with zeros to the same number of columns
+	width = max([level_n.shape[1] for level_n in n])
+	n = np.vstack([np.pad(level_n, ((0,0),(0,width-level_n.shape[1]))) for level_n in n])
+	if len(args.levels) > 1:
+		header = "#sample\tlevel"
+	else:
+		header = "#sample"
+		labels = names
+
 	# calculations
-	N = sum(n) # total number of individuals
-	S = len(n) # total number of species
-	# calculate all the pi's
-	p = [] # store pi's 
-	D = 0
-	for i in n: # go through each species
-		if i != 0: # there should not be any zeros
-			p.append(i/N) # pi is the ni/N
-			D += i*(i-1)
-	
-	D = D/(N*(N-1))
-	# find the indicated alpha
-	if args.value == 'Sh': # calculate shannon's diversity
-		shannons_alpha(p)
-	elif args.value == 'BP': # calculate berger-parker's dominance index
-		berger_parkers_alpha(p)
-	elif args.value == 'Si': # calculate Simpson's alpha 
-		simpsons_alpha(D)
-	elif args.value == 'ISi': # calculate Inverse Simpson's alpha 
-		inverse_simpsons_alpha(D)
-	elif args.value == 'F': # calculate fisher's alpha
-		print("Fisher's alpha...loading")
-		global N_f
-		N_f = sum(n)
-		global S_f
-		S_f = len(n)
-		fishers_alpha()
+	alphas = [alpha for alpha in ALPHAS if alpha[0] in args.values or 'all' in args.values]
+	if len(args.depths) == 0:
+		values = alpha_diversity(n)
+	else:
+		[means, sds, observed] = rarefaction(n, args.depths, args.iterations, args.seed)
+
+	# print one table row per sample (and depth)
+	if args.out_file == '':
+		o_file = sys.stdout
 	else:
-		print("Not a supported alpha")
+		o_file = open(args.out_file, 'w')
+	if len(args.depths) == 0:
+		o_file.write(header + "\t" + "\t".join([alpha[1] for alpha in alphas]) + "\n")
+		columns = [values[alpha[0]].tolist() for alpha in alphas]
+		o_file.writelines([labels[i] + "\t" + "\t".join([str(column[i]) for column in columns]) + "\n" for i in range(len(names))])
+	else:
+		o_file.write(header + "\tdepth\t" + "\t".join([alpha[1] + " mean\t" + alpha[1] + " sd" for alpha in alphas]) + "\n")
+		for i in range(len(names)):
+			for j in range(len(args.depths)):
+				vals = []
+				for alpha in alphas:
+					vals += [str(means[alpha[0]][i,j]), str(sds[alpha[0]][i,j])]
+				o_file.write(labels[i] + "\t" + str(args.depths[j]) + "\t" + "\t".join(vals) + "\n")
+	if o_file is not sys.stdout:
+		o_file.close()
+
+	# print rarefaction curve: one line per depth, one column per sample
+	if len(args.depths) > 0 and args.curve_file != '':
+		c_file = open(args.curve_file, 'w')
+		c_file.write("#depth\t" + "\t".join([label.replace("\t", " ") for label in labels]) + "\n")
+		for j in range(len(args.depths)):
+			c_file.write(str(args.depths[j]) + "\t" + "\t".join([str(val) for val in observed[:,j].tolist()]) + "\n")
+		c_file.close()
 
 if __name__ == "__main__":
     main()
-
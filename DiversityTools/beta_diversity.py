@@ -42,15 +42,399 @@
 #Input options:
 #   --level [S, G, etc].......user specifies which level to measure at
 #                             (for kraken, krona, or bracken input files)
+#                             kraken and krona files are parsed into a tree of taxa
+#                             (see kreport_levels.py) and all reads within the
+#                             clade of each taxon at that level are counted
+#   --metric X................braycurtis [default], jaccard, aitchison, unifrac
+#                             or wunifrac (weighted unifrac)
+#   --taxonomy X..............make_ktaxonomy.py taxonomy file (for unifrac)
+#Output options:
+#   -o X, --output X..........output file [default: print to screen]
+#   --output-format X.........text [default], tsv, pairs or npy (condensed)
+#   --pcoa X..................output file for principal coordinates analysis
+#   --pcoa-axes X.............number of PCoA axes [default: 3]
+#
+#All samples are aligned into a samples x categories matrix of counts and
+#dissimilarities are calculated with numpy, one tile of samples at a time.
+#Tiles can be calculated in parallel (--threads) and saved to a memory-mapped
+#matrix file (--matrix-file), which also allows resuming an interrupted run.
+#The matrix can also be calculated in memory from the counts of each sample
+#(see sample_counts and beta_diversity).
 ####################################################################
 import os, sys, argparse
 import operator
 from time import gmtime
 from time import strftime
+import hashlib
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
+from kreport_levels import load_tree, read_taxonomy
+####################################################################
+#fill_counts
+#usage: aligns the counts of all samples into a samples x categories matrix
+#input: dictionaries of counts per category for each sample 
+#returns: numpy matrix of counts and list of categories (one per column)
+def fill_counts(i2counts, num_samples):
+    categ2col = {}
+    for i in range(num_samples):
+        for categ in i2counts[i]:
+            if categ not in categ2col:
+                categ2col[categ] = len(categ2col)
+    counts = np.zeros((num_samples, len(categ2col)))
+    for i in range(num_samples):
+        cols = [categ2col[categ] for categ in i2counts[i]]
+        counts[i, cols] = list(i2counts[i].values())
+    return [counts, list(categ2col)]
+#tree_counts
+#usage: propagates the counts of each taxid (category) up the make_ktaxonomy.py 
+#   taxonomy tree, one tree level at a time, so each taxon's column holds 
+#   the counts of its whole clade. The root is not included (each remaining
+#   taxon is the branch to its parent, of length 1)
+#input: samples x categories matrix of counts, taxid of each category, 
+#   taxonomy filename
+#returns: samples x taxa matrix of clade counts, total counts of each sample 
+#   found in the taxonomy
+def tree_counts(counts, categories, tax_file):
+    #Read taxonomy 
+    [taxid2parent, taxid2depth] = read_taxonomy(tax_file)
+    #Save each category and all of its ancestors as rows
+    taxid2row = {}
+    cols = []
+    rows = []
+    for col in range(len(categories)):
+        taxid = categories[col]
+        if taxid not in taxid2parent:
+            sys.stderr.write("Taxonomy ID %s not found in %s (ignored)\n" % (taxid, tax_file))
+            continue
+        cols.append(col)
+        rows.append(taxid2row.setdefault(taxid, len(taxid2row)))
+        while taxid2parent[taxid] != taxid and taxid2parent[taxid] not in taxid2row:
+            taxid = taxid2parent[taxid]
+            taxid2row[taxid] = len(taxid2row)
+    taxids = list(taxid2row)
+    parents = np.array([taxid2row[taxid2parent[taxid]] if taxid2parent[taxid] != taxid else -1 for taxid in taxids], dtype=np.int64)
+    depths = np.array([taxid2depth[taxid] for taxid in taxids], dtype=np.int64)
+    #Fill taxa x samples matrix, then add each level's counts to the level above
+    clades = np.zeros((len(taxids), counts.shape[0]))
+    np.add.at(clades, np.array(rows, dtype=np.int64), counts[:, cols].T)
+    for depth in range(depths.max(initial=0), 0, -1):
+        level = np.flatnonzero((depths == depth) & (parents >= 0))
+        np.add.at(clades, parents[level], clades[level])
+    #Remove root(s)
+    totals = clades[parents < 0].sum(axis=0)
+    return [np.ascontiguousarray(clades[parents >= 0].T), totals]
+#prepare_counts
+#usage: transforms the matrix of counts for a given metric
+#   - braycurtis: counts
+#   - jaccard, unifrac: presence (1) / absence (0) of each category/clade
+#   - aitchison: centered log-ratio of counts (with a pseudocount of 1)
+#   - braycurtis, wunifrac: unchanged
+#returns: samples x categories matrix 
+def prepare_counts(counts, metric):
+    if metric in ['jaccard', 'unifrac']:
+        return (counts > 0).astype(np.float64)
+    elif metric == 'aitchison':
+        logs = np.log(counts + 1.0)
+        return logs - logs.mean(axis=1, keepdims=True)
+    return counts
+#row_totals
+#usage: calculates the per-sample values used by each metric: sum of values
+#   (sum of squares for aitchison)
+def row_totals(values, metric):
+    if metric == 'aitchison':
+        return (values*values).sum(axis=1)
+    return values.sum(axis=1)
+#min_sums
+#usage: calculates the sum of the shared counts (sum of minimum counts per
+#   category) for each pair of rows from two blocks of samples. Each row of a
+#   is only compared over its own non-zero categories (as in a sparse/CSR 
+#   row), against the categories x samples (transposed) block of b
+#input: two blocks of the counts matrix 
+#returns: block of sums of minimum counts (rows of a x rows of b)
+def min_sums(a, b):
+    sums = np.zeros((a.shape[0], b.shape[0]))
+    b_cols = np.ascontiguousarray(b.T)
+    for i in range(a.shape[0]):
+        cols = np.flatnonzero(a[i])
+        sums[i] = np.minimum(b_cols[cols], a[i, cols, None]).sum(axis=0)
+    return sums
+#beta_tile
+#usage: calculates the dissimilarities for one tile of the matrix
+#   (samples i_start to i_end vs samples j_start to j_end)
+#   - braycurtis: 1 - 2*(sum of shared counts)/(sum of both totals)
+#   - jaccard, unifrac: 1 - shared/total categories (or branches) present
+#   - aitchison: euclidean distance between centered log-ratios
+#   - wunifrac: sum of absolute differences of clade fractions (per branch)
+#input: prepared matrix (see prepare_counts), row totals, metric, tile
+#returns: block of dissimilarities
+def beta_tile(values, totals, metric, i_start, i_end, j_start, j_end):
+    a = values[i_start:i_end]
+    b = values[j_start:j_end]
+    tot_ij = totals[i_start:i_end, None] + totals[None, j_start:j_end]
+    if metric == 'braycurtis':
+        C_ij = min_sums(a, b)
+        return 1.0 - np.divide(2.0*C_ij, tot_ij, out=np.zeros(C_ij.shape), where=(tot_ij > 0))
+    elif metric in ['jaccard', 'unifrac']:
+        shared = a.dot(b.T)
+        union = tot_ij - shared
+        return 1.0 - np.divide(shared, union, out=np.ones(shared.shape), where=(union > 0))
+    elif metric == 'aitchison':
+        return np.sqrt(np.maximum(tot_ij - 2.0*a.dot(b.T), 0.0))
+    elif metric == 'wunifrac':
+        return np.maximum(tot_ij - 2.0*min_sums(a, b), 0.0)
+#init_tile_worker
+#usage: attaches the prepared matrix (in shared memory) for all tiles computed 
+#   in this process (run once per process)
+tile_values = None
+tile_totals = None
+tile_metric = ''
+tile_shm = None
+def init_tile_worker(shm_name, shape, metric):
+    global tile_values, tile_totals, tile_metric, tile_shm
+    tile_shm = shared_memory.SharedMemory(name=shm_name)
+    tile_values = np.ndarray(shape, dtype=np.float64, buffer=tile_shm.buf)
+    tile_totals = row_totals(tile_values, metric)
+    tile_metric = metric
+#compute_tile
+#usage: calculates one tile of the matrix (possibly in a separate process)
+#input: list of the tile's i_start, i_end, j_start, j_end 
+#returns: list of the tile's i_start, i_end, j_start, j_end and values
+def compute_tile(params):
+    [i_start, i_end, j_start, j_end] = params
+    tile = beta_tile(tile_values, tile_totals, tile_metric, i_start, i_end, j_start, j_end)
+    return [i_start, i_end, j_start, j_end, tile]
+#fingerprint
+#usage: identifies the input values of a matrix file, so that an interrupted
+#   run is only continued with the same inputs
+#returns: hex digest of the shape and values
+def fingerprint(values):
+    digest = hashlib.sha1(("%i,%i" % values.shape).encode())
+    digest.update(values.tobytes())
+    return digest.hexdigest()
+#read_progress
+#usage: reads the tiles already saved to a matrix file by an interrupted run
+#returns: set of (i_start, j_start) of each saved tile
+def read_progress(progress_file, num_samples, tile_size, metric, inputs):
+    done = set()
+    if not os.path.isfile(progress_file):
+        return done
+    p_file = open(progress_file, 'r')
+    for line in p_file:
+        l_vals = line.strip().split("\t")
+        if l_vals[0] == "#samples":
+            if int(l_vals[1]) != num_samples or int(l_vals[3]) != tile_size or l_vals[5:8] != [metric, 'inputs', inputs]:
+                sys.stderr.write("%s does not match the current inputs/tile size/metric\n" % progress_file)
+                sys.stderr.write("(remove it to calculate a new matrix)\n")
+                exit(1)
+        elif len(l_vals) == 2:
+            done.add((int(l_vals[0]), int(l_vals[1])))
+    p_file.close()
+    return done
+#beta_matrix
+#usage: calculates the dissimilarity for all pairs of samples,
+#   one tile of the upper triangle at a time (in parallel with threads > 1). 
+#   Given a matrix file, results are saved to a memory-mapped .npy file and 
+#   each saved tile is recorded in <matrix file>.progress, so an interrupted 
+#   run (with the same input values) continues with the remaining tiles. 
+#   The progress file is removed once all tiles are saved
+#input: samples x categories matrix of counts, metric, tile size (samples 
+#   per side), number of processes, matrix file [default: keep in memory]
+#returns: samples x samples matrix of dissimilarities
+def beta_matrix(counts, metric='braycurtis', tile_size=500, threads=1, matrix_file=''):
+    num_samples = counts.shape[0]
+    values = np.ascontiguousarray(prepare_counts(counts, metric), dtype=np.float64)
+    #Determine tiles of the upper triangle
+    tiles = []
+    for i in range(0, num_samples, tile_size):
+        i_end = min(i + tile_size, num_samples)
+        for j in range(i, num_samples, tile_size):
+            j_end = min(j + tile_size, num_samples)
+            tiles.append([i, i_end, j, j_end])
+    #Open output matrix 
+    p_file = None
+    if matrix_file == '':
+        bc = np.zeros((num_samples,num_samples))
+    else:
+        progress_file = matrix_file + ".progress"
+        inputs = fingerprint(values)
+        done = read_progress(progress_file, num_samples, tile_size, metric, inputs)
+        if len(done) > 0 and os.path.isfile(matrix_file):
+            bc = np.lib.format.open_memmap(matrix_file, mode='r+')
+            tiles = [tile for tile in tiles if (tile[0], tile[2]) not in done]
+        else:
+            bc = np.lib.format.open_memmap(matrix_file, mode='w+', dtype=np.float64, shape=(num_samples,num_samples))
+            p_file = open(progress_file, 'w')
+            p_file.write("#samples\t%i\ttile_size\t%i\tmetric\t%s\tinputs\t%s\n" % (num_samples, tile_size, metric, inputs))
+        if p_file is None:
+            p_file = open(progress_file, 'a')
+    #Calculate tiles
+    shm = None
+    if threads > 1 and len(tiles) > 1:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        pool = multiprocessing.Pool(threads, init_tile_worker, (shm.name, values.shape, metric))
+        results = pool.imap_unordered(compute_tile, tiles)
+    else:
+        global tile_values, tile_totals, tile_metric
+        pool = None
+        tile_values = values
+        tile_totals = row_totals(values, metric)
+        tile_metric = metric
+        results = map(compute_tile, tiles)
+    for [i, i_end, j, j_end, tile] in results:
+        bc[i:i_end, j:j_end] = tile
+        bc[j:j_end, i:i_end] = tile.T
+        if p_file is not None:
+            bc.flush()
+            p_file.write("%i\t%i\n" % (i, j))
+            p_file.flush()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+    np.fill_diagonal(bc, 0.0)
+    if p_file is not None:
+        bc.flush()
+        p_file.close()
+        #All tiles saved: a later run calculates a new matrix
+        os.remove(progress_file)
+    return bc
+#sample_counts
+#usage: counts of one sample as a dictionary of category to counts 
+#   (only positive counts, repeated categories are summed)
+#input: list of categories (e.g. taxa from TaxaTree.level_counts), counts
+#returns: dictionary of counts per category
+def sample_counts(categories, counts):
+    sample = {}
+    for [categ, count] in zip(categories, np.asarray(counts).tolist()):
+        if count > 0:
+            sample[categ] = sample.get(categ, 0) + int(count)
+    return sample
+#beta_diversity
+#usage: calculates the matrix of dissimilarities between samples in memory
+#input: 
+#   - dictionaries of counts per category for each sample (see sample_counts)
+#   - metric (braycurtis, jaccard, aitchison, unifrac, wunifrac)
+#   - taxonomy filename from make_ktaxonomy.py (for unifrac/wunifrac, 
+#       categories must be taxonomy IDs)
+#   - tile size, number of processes and matrix file (see beta_matrix)
+#returns: samples x samples matrix of dissimilarities
+def beta_diversity(samples, metric='braycurtis', tax_file='', tile_size=500, threads=1, matrix_file=''):
+    [counts, categories] = fill_counts(samples, len(samples))
+    if metric in ['unifrac','wunifrac']:
+        [counts, totals] = tree_counts(counts, categories, tax_file)
+        #weighted: fraction of each sample's reads within each clade
+        if metric == 'wunifrac':
+            counts = np.divide(counts, totals[:, None], out=np.zeros(counts.shape), where=(totals[:, None] > 0))
+    return beta_matrix(counts, metric, tile_size, threads, matrix_file)
+#centered_product
+#usage: multiplies the double-centered matrix of squared dissimilarities
+#   B = -1/2 J D^2 J (J = I - 11'/n) by x without building B, reading D
+#   (possibly memory-mapped) one block of rows at a time
+#input: samples x samples matrix of dissimilarities, row means and overall
+#   mean of D^2, samples x k matrix x, block size
+#returns: samples x k matrix B x
+def centered_product(bc, row_means, mean, x, block_size=1000):
+    ax = np.zeros(x.shape)
+    for i in range(0, bc.shape[0], block_size):
+        block = np.asarray(bc[i:i+block_size], dtype=np.float64)
+        ax[i:i+block_size] = (block*block).dot(x)
+    col_sums = x.sum(axis=0)
+    return -0.5*(ax - np.outer(row_means, col_sums) - np.outer(np.ones(x.shape[0]), row_means.dot(x)) + mean*col_sums)
+#pcoa
+#usage: principal coordinates analysis of the matrix of dissimilarities.
+#   For up to full_size samples, the double-centered matrix is fully
+#   decomposed. Otherwise only the top eigenvalues/vectors are calculated,
+#   by a randomized eigendecomposition (random projection with power 
+#   iterations, until the top eigenvalues change by less than tol relative
+#   to the largest one), so the full matrix is never decomposed
+#input: samples x samples matrix of dissimilarities, number of axes, random
+#   seed, tolerance, maximum number of power iterations, number of samples
+#   decomposed fully
+#returns: samples x axes matrix of coordinates, eigenvalues and proportion 
+#   of variance explained by each axis
+def pcoa(bc, axes=3, seed=0, tol=1e-6, max_iterations=100, full_size=1000):
+    num_samples = bc.shape[0]
+    axes = min(axes, num_samples)
+    #Row/overall means of squared dissimilarities
+    row_means = np.zeros(num_samples)
+    for i in range(0, num_samples, 1000):
+        block = np.asarray(bc[i:i+1000], dtype=np.float64)
+        row_means[i:i+1000] = (block*block).mean(axis=1)
+    mean = row_means.mean()
+    if num_samples <= full_size:
+        #Full eigendecomposition
+        [eigvals, eigvecs] = np.linalg.eigh(centered_product(bc, row_means, mean, np.eye(num_samples)))
+    else:
+        #Random projection (oversampled), refined by power iterations: the
+        #   eigenvalues of the projected matrix converge to the top eigenvalues
+        rng = np.random.default_rng(seed)
+        size = min(num_samples, axes + 10)
+        q = np.linalg.qr(rng.standard_normal((num_samples, size)))[0]
+        prev_top = None
+        for i in range(max_iterations + 1):
+            bq = centered_product(bc, row_means, mean, q)
+            [eigvals, eigvecs] = np.linalg.eigh(q.T.dot(bq))
+            top = np.sort(eigvals)[::-1][:axes]
+            if prev_top is not None and np.abs(top - prev_top).max() <= tol*np.abs(top).max():
+                break
+            if i == max_iterations:
+                sys.stderr.write("WARNING: PCoA eigenvalues did not converge in %i iterations\n" % max_iterations)
+                break
+            prev_top = top
+            q = np.linalg.qr(bq)[0]
+        eigvecs = q.dot(eigvecs)
+    order = np.argsort(eigvals)[::-1][:axes]
+    eigvals = eigvals[order]
+    eigvecs = eigvecs[:, order]
+    coords = eigvecs * np.sqrt(np.maximum(eigvals, 0.0))
+    #Total variance: trace of the double-centered matrix
+    total = 0.5 * num_samples * mean
+    explained = eigvals / total if total > 0 else np.zeros(len(eigvals))
+    return [coords, eigvals, explained]
+#write_pcoa
+#usage: writes the eigenvalue and proportion of variance explained of each 
+#   axis, followed by the coordinates of each sample
+def write_pcoa(coords, eigvals, explained, names, o_file):
+    axes = ["PC%i" % (i+1) for i in range(len(eigvals))]
+    o_file.write("#sample\t" + "\t".join(axes) + "\n")
+    o_file.write("#eigenvalue\t" + "\t".join(map(str, eigvals.tolist())) + "\n")
+    o_file.write("#proportion_explained\t" + "\t".join(map(str, explained.tolist())) + "\n")
+    for i in range(coords.shape[0]):
+        o_file.write(names[i] + "\t" + "\t".join(map(str, coords[i].tolist())) + "\n")
+#write_condensed
+#usage: saves the upper triangle of the matrix (row by row, excluding the 
+#   diagonal) as a condensed vector in a memory-mapped .npy file
+def write_condensed(bc, out_file):
+    num_samples = bc.shape[0]
+    condensed = np.lib.format.open_memmap(out_file, mode='w+', dtype=np.float64,
+        shape=(int(num_samples*(num_samples-1)/2),))
+    start = 0
+    for i in range(num_samples - 1):
+        condensed[start:start+num_samples-i-1] = bc[i, i+1:]
+        start += num_samples-i-1
+    condensed.flush()
+#write_tsv
+#usage: writes the full symmetric matrix (full precision) with sample names,
+#   formatting each row in bulk
+def write_tsv(bc, names, o_file):
+    o_file.write("#sample\t" + "\t".join(names) + "\n")
+    for i in range(bc.shape[0]):
+        o_file.write(names[i] + "\t" + "\t".join(map(str, bc[i].tolist())) + "\n")
+#write_pairs
+#usage: writes each pair of samples (upper triangle) as one line: 
+#   sample 1, sample 2, dissimilarity (full precision)
+def write_pairs(bc, names, o_file):
+    for i in range(bc.shape[0] - 1):
+        prefix = names[i] + "\t"
+        o_file.writelines([prefix + names[j] + "\t" + str(val) + "\n" 
+            for [j, val] in enumerate(bc[i, i+1:].tolist(), i+1)])
 ####################################################################
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--input','--input-files',
@@ -63,9 +447,34 @@ def main():
             bracken, kreport, kreport2, krona. See docs for details')
     parser.add_argument('--cols','--columns', dest='cols',required=False, default='1,2',
         help='Specify category/counts separated by single comma: cat,counts (1 = first col)')
-    parser.add_argument('--level', '-l', dest='lvl', required=False, default='all',choices=['all', 'S', 'G', 'F', 'O'],
-        help='For Kraken or Krona files, taxonomy level for which to compare samples. Default: all')
-    args=parser.parse_args()
+    parser.add_argument('--level', '-l', dest='lvl', required=False, default='all',choices=['all', 'S', 'G', 'F', 'O', 'C', 'P', 'D'],
+        help='For Kraken or Krona files, taxonomy level for which to compare samples \
+            (reads within the clade of each taxon at the level). Default: all')
+    parser.add_argument('--metric', dest='metric', required=False, default='braycurtis',
+        choices=['braycurtis','jaccard','aitchison','unifrac','wunifrac'],
+        help='Dissimilarity metric: braycurtis, jaccard, aitchison, unifrac (unweighted) or \
+            wunifrac (weighted), UniFrac requires --taxonomy. Default: braycurtis')
+    parser.add_argument('--taxonomy', '-t', dest='tax_file', required=False, default='',
+        help='Taxonomy file from make_ktaxonomy.py (for UniFrac, categories must be taxonomy IDs)')
+    parser.add_argument('-o', '--output', dest='out_file', required=False, default='',
+        help='Output file. Default: print to screen')
+    parser.add_argument('--output-format', dest='out_format', required=False, default='text',
+        choices=['text','tsv','pairs','npy'],
+        help='Output format: text [upper triangle, 3 decimals], tsv [full matrix], \
+            pairs [one line per pair of samples] or npy [condensed upper triangle, requires -o]. Default: text')
+    parser.add_argument('--pcoa', dest='pcoa_file', required=False, default='',
+        help='Output file for the principal coordinates analysis (PCoA) of the matrix')
+    parser.add_argument('--pcoa-axes', dest='pcoa_axes', required=False, default=3, type=int,
+        help='Number of PCoA axes to calculate. Default: 3')
+    parser.add_argument('--seed', dest='seed', required=False, default=0, type=int,
+        help='Random seed for the PCoA. Default: 0')
+    parser.add_argument('--threads', dest='threads', required=False, default=1, type=int,
+        help='Number of processes used to calculate the matrix. Default: 1')
+    parser.add_argument('--matrix-file', dest='matrix_file', required=False, default='',
+        help='Save the matrix to a memory-mapped .npy file (an interrupted run continues where it stopped)')
+    parser.add_argument('--tile-size', dest='tile_size', required=False, default=500, type=int,
+        help='Number of samples per side of each tile of the matrix calculated at once. Default: 500')
+    args=parser.parse_args(argv)
 
     #################################################
     #Test input files
@@ -78,6 +487,13 @@ def main():
             sys.stderr.write("File %s not found\n" % f)
             exit(1)
 
+    if args.out_format == 'npy' and args.out_file == '':
+        sys.stderr.write("Please specify an output file (-o) for '--output-format npy'\n")
+        exit(1)
+    if args.metric in ['unifrac','wunifrac'] and args.tax_file == '':
+        sys.stderr.write("Please specify a taxonomy file (--taxonomy) for '--metric %s'\n" % args.metric)
+        exit(1)
+
     #################################################
     #Determine columns for extracting
     categ_col = -1
@@ -99,15 +515,10 @@ def main():
             count_col = int(count_col) - 1
     elif args.filetype == "bracken":
         categ_col = 0 # TODO taxid (col 1) does not seem to be properly set
+        if args.metric in ['unifrac','wunifrac']:
+            categ_col = 1
         count_col = 5
         taxlvl_col = 2
-    elif args.filetype == "kreport" or args.filetype == "kreport2": # TODO: what about kuniq reports?
-        categ_col = 4
-        count_col = 2
-        taxlvl_col = 3
-    elif args.filetype == "krona":
-        categ_col = 1
-        count_col = 0
     #################################################
     #STEP 1: READ IN SAMPLES
     i2totals = {}
@@ -146,7 +557,15 @@ def main():
                 num_categories += 1
         i_file.close()
         #sys.stdout.write("\t....finished reading counts for %i samples in %i categories\n" % (num_samples,num_categories))
-    else: # for braken, kraken, kraken2 and krona
+    elif args.filetype in ['kreport','kreport2','krona']:
+        #KRAKEN REPORTS/KRONA FILES: COUNT READS IN THE CLADE OF EACH TAXON AT THE LEVEL
+        for f in args.in_files:
+            [taxa, taxa_counts] = load_tree(f, args.filetype).level_counts(args.lvl)
+            i2names[num_samples] = f
+            i2counts[num_samples] = sample_counts(taxa, taxa_counts)
+            i2totals[num_samples] = sum(i2counts[num_samples].values())
+            num_samples += 1
+    else: # for braken
         num_samples = 0
         i2names = {}
         i2totals = {}
@@ -168,48 +587,23 @@ def main():
                     continue
 
                 if int(l_vals[count_col]) > 0:
-                    if args.filetype == "krona":
-                        # we don't know which column will be the genus type (might change for every line)
-                        # hence, we iterate over it
-                        for i in range(count_col, len(l_vals)):
-                            if l_vals[i].startswith(args.lvl.lower() + "__") or args.lvl == "all":
-                                categ_col = i
-                                tax_name = l_vals[categ_col]
-                                i2totals[num_samples] += int(l_vals[count_col])
-                                if not tax_name in i2counts[num_samples]:
-                                    i2counts[num_samples][tax_name] = 0
-                                i2counts[num_samples][tax_name] += int(l_vals[count_col])
-                                # sys.stdout.write("%s\t%s\t%i\n" % (f, tax_name, int(l_vals[count_col])))
-                    else:
-                        if l_vals[taxlvl_col][0] == args.lvl or args.lvl == "all": # TODO: what if it is G1?
-                            # TODO: cant do this because of broken bracken files: tax_id = int(l_vals[categ_col])
-                            tax_id = l_vals[categ_col]
-                            genus[num_samples][tax_id] = l_vals[0]
-                            i2totals[num_samples] += int(l_vals[count_col])
-                            if tax_id not in i2counts[num_samples]:
-                                i2counts[num_samples][tax_id] = 0
-                            i2counts[num_samples][tax_id] += int(l_vals[count_col])
-                            # sys.stdout.write("%s\t%s\t%i\n" % (f, line, i2counts[num_samples][tax_id]))
+                    if l_vals[taxlvl_col][0] == args.lvl or args.lvl == "all":
+                        # TODO: cant do this because of broken bracken files: tax_id = int(l_vals[categ_col])
+                        tax_id = l_vals[categ_col]
+                        genus[num_samples][tax_id] = l_vals[0]
+                        i2totals[num_samples] += int(l_vals[count_col])
+                        if tax_id not in i2counts[num_samples]:
+                            i2counts[num_samples][tax_id] = 0
+                        i2counts[num_samples][tax_id] += int(l_vals[count_col])
+                        # sys.stdout.write("%s\t%s\t%i\n" % (f, line, i2counts[num_samples][tax_id]))
             i_file.close()
             num_samples += 1
     #################################################
-    #STEP 2: CALCULATE BRAY-CURTIS DISSIMILARITIES
+    #STEP 2: CALCULATE DISSIMILARITIES
     #sys.stdout.write(">>STEP 2: COMPARING SAMPLES TO CALCULATE DISSIMILARITIES\n")
 
-    bc = np.zeros((num_samples,num_samples))
-    for i in range(0,num_samples):
-        i_tot = i2totals[i]
-        for j in range(i+1, num_samples):
-            j_tot = i2totals[j]
-            C_ij = 0.0
-            for cat in i2counts[i]:
-                if cat in i2counts[j]:
-                    C_ij += min(i2counts[i][cat], i2counts[j][cat])
-            #Calculate bray-curtis dissimilarity
-            bc_ij = 1.0 - ((2.0*C_ij)/float(i_tot+j_tot))
-            #sys.stdout.write("%s\t%s\t%i\t%i\t%i\n" % (i2names[i], i2names[j], C_ij, i_tot, j_tot))
-            bc[i][j] = bc_ij
-            bc[j][i] = bc_ij
+    bc = beta_diversity([i2counts[i] for i in range(num_samples)], args.metric, args.tax_file,
+        args.tile_size, args.threads, args.matrix_file)
 
     # for i in range(0,num_samples):
     #     sys.stdout.write("Totals: %s\t%i\n" % (i2names[i], i2totals[i]))
@@ -217,25 +611,39 @@ def main():
     #         sys.stdout.write("%i\t%s\t%i\n" % (cat, genus[i][cat], i2counts[i][cat]))
 
     #################################################
-    #sys.stdout.write(">>STEP 3: PRINTING MATRIX OF BRAY_CURTIS DISSIMILARITIES\n")
+    #sys.stdout.write(">>STEP 3: PRINTING MATRIX OF DISSIMILARITIES\n")
     #sys.stdout.flush()
-    #Print samples
-    for i in i2names:
-        sys.stdout.write("#%i\t%s (%i reads)\n" % (i,i2names[i],i2totals[i]))
-    #Print headers
-    sys.stdout.write("x")
-    for i in range(num_samples):
-        sys.stdout.write("\t%i" % i)
-    sys.stdout.write("\n")
-    #Print matrix
-    for i in range(num_samples):
-        sys.stdout.write("%i" % i)
-        for j in range(num_samples):
-            if i <= j:
-                sys.stdout.write("\t%0.3f" % bc[i][j])
-            else:
-                sys.stdout.write("\tx.xxx")
-        sys.stdout.write("\n")
+    names = [i2names[i] for i in range(num_samples)]
+    if args.out_format == 'npy':
+        write_condensed(bc, args.out_file)
+    if args.out_file == '' or args.out_format == 'npy':
+        o_file = sys.stdout
+    else:
+        o_file = open(args.out_file, 'w')
+    if args.out_format == 'tsv':
+        write_tsv(bc, names, o_file)
+    elif args.out_format == 'pairs':
+        write_pairs(bc, names, o_file)
+    else:
+        #Print samples
+        for i in i2names:
+            o_file.write("#%i\t%s (%i reads)\n" % (i,i2names[i],i2totals[i]))
+    if args.out_format == 'text':
+        #Print headers
+        o_file.write("x\t" + "\t".join([str(i) for i in range(num_samples)]) + "\n")
+        #Print matrix
+        for i in range(num_samples):
+            vals = ["x.xxx"]*i + ["%0.3f" % val for val in bc[i, i:].tolist()]
+            o_file.write(str(i) + "\t" + "\t".join(vals) + "\n")
+    if o_file is not sys.stdout:
+        o_file.close()
+
+    #Principal coordinates analysis
+    if args.pcoa_file != '':
+        [coords, eigvals, explained] = pcoa(bc, args.pcoa_axes, args.seed)
+        p_file = open(args.pcoa_file, 'w')
+        write_pcoa(coords, eigvals, explained, names, p_file)
+        p_file.close()
 
 ####################################################################
 if __name__ == "__main__":
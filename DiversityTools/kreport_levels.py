@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+################################################################
+#kreport_levels.py parses kraken reports and krona files into a tree of
+#taxa to count reads at any taxonomic level
+#Copyright (C) 2019 Jennifer Lu, jlu26@jhmi.edu
+#
+#This file is part of KrakenTools
+#KrakenTools is free software; you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation; either version 3 of the license, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+#################################################################
+#Jennifer Lu, jlu26@jhmi.edu
+#Updated: 08/12/2019
+#
+#Each report is parsed once into a tree of taxa. Reads are counted at a
+#given level (S, G, F, O, C, P, D) by adding the reads of each taxon's
+#whole clade (including strains and intermediate ranks below it), so taxa
+#at sublevels (e.g. S1) are never counted as separate taxa.
+#Counting reads at multiple levels only requires parsing each file once
+#(callers keep the tree while counting each level). Taxonomy files, and
+#reports in krakentools.py pipelines, are shared with the other programs
+#run in the same process (see kraken_cache.py).
+#
+#Used by alpha_diversity.py and beta_diversity.py
+#
+#Methods
+#   - read_kreport
+#   - read_krona
+#   - read_taxonomy
+#   - load_tree
+#Classes
+#   - TaxaTree
+####################################################################
+import os, sys
+import numpy as np
+#kraken_cache.py is in the KrakenTools directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import kraken_cache
+
+#TaxaTree Class
+#usage: taxa of a single sample, each with a name (taxid or krona name),
+#   level, parent (-1 for the top level), depth and reads assigned to the
+#   taxon itself
+class TaxaTree(object):
+    'Tree of taxa for a single sample.'
+    def __init__(self, names, levels, parents, depths, counts):
+        self.names = names
+        self.levels = np.array(levels, dtype=str)
+        self.parents = np.array(parents, dtype=np.int64)
+        self.depths = np.array(depths, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.float64)
+        self.clades = None
+    #clade_counts
+    #usage: returns the reads in the clade of each taxon (computed once,
+    #   adding each level's counts to its parents, from the deepest level up)
+    def clade_counts(self):
+        if self.clades is None:
+            clades = self.counts.copy()
+            for depth in range(self.depths.max(initial=0), 0, -1):
+                level = np.flatnonzero((self.depths == depth) & (self.parents >= 0))
+                np.add.at(clades, self.parents[level], clades[level])
+            self.clades = clades
+        return self.clades
+    #level_counts
+    #usage: returns the taxa at the given level with the reads in their
+    #   clades, or all taxa with their own reads for level 'all'
+    #returns: list of names and numpy array of reads
+    def level_counts(self, level):
+        if level == 'all':
+            return [self.names, self.counts]
+        rows = np.flatnonzero(self.levels == level)
+        return [[self.names[i] for i in rows.tolist()], self.clade_counts()[rows]]
+
+#read_kreport
+#usage: parses a kraken/kraken2/krakenuniq report (filename or report lines)
+#   into a tree of taxa (based on the number of spaces before each taxon's name)
+#returns: TaxaTree (names are taxonomy IDs)
+def read_kreport(filename):
+    names = []
+    levels = []
+    parents = []
+    depths = []
+    counts = []
+    map_kuniq = {'species':'S','genus':'G','family':'F',
+        'order':'O','class':'C','phylum':'P','superkingdom':'D',
+        'kingdom':'K'}
+    ancestors = []
+    if isinstance(filename, str):
+        r_file = open(filename, 'r')
+    else:
+        r_file = filename
+    for line in r_file:
+        l_vals = line.strip('\r\n').split('\t')
+        if len(l_vals) < 5 or not l_vals[2].strip().isdigit():
+            continue
+        #Kraken: level type, taxid, name; KrakenUniq: taxid, level type, name
+        if l_vals[-2].isdigit():
+            [level, taxid] = l_vals[-3:-1]
+        else:
+            [taxid, level] = l_vals[-3:-1]
+            level = map_kuniq.get(level, '-')
+        name = l_vals[-1]
+        depth = int((len(name) - len(name.lstrip(' ')))/2)
+        del ancestors[depth:]
+        names.append(taxid)
+        levels.append(level)
+        parents.append(ancestors[-1] if len(ancestors) > 0 else -1)
+        depths.append(depth)
+        counts.append(int(l_vals[2]))
+        ancestors.append(len(names) - 1)
+    if r_file is not filename:
+        r_file.close()
+    return TaxaTree(names, levels, parents, depths, counts)
+
+#read_krona
+#usage: parses a krona text file or lines (as output by kreport2krona.py) into a tree
+#   of taxa: each line is the number of reads followed by the path of the taxon
+#   (levels are given by the prefix of each name, k__ = D)
+#returns: TaxaTree (names are krona names, e.g. s__Escherichia_coli)
+def read_krona(filename):
+    names = []
+    levels = []
+    parents = []
+    depths = []
+    counts = []
+    path2row = {}
+    if isinstance(filename, str):
+        k_file = open(filename, 'r')
+    else:
+        k_file = filename
+    for line in k_file:
+        l_vals = line.strip('\r\n').split('\t')
+        if len(l_vals) < 2 or not l_vals[0].isdigit():
+            continue
+        #Add the taxon and any ancestors not yet found
+        parent = -1
+        for depth in range(1, len(l_vals)):
+            path = "\t".join(l_vals[1:depth+1])
+            if path not in path2row:
+                level = l_vals[depth].split('__')[0].upper()
+                if level == 'K':
+                    level = 'D'
+                path2row[path] = len(names)
+                names.append(l_vals[depth])
+                levels.append(level)
+                parents.append(parent)
+                depths.append(depth-1)
+                counts.append(0)
+            parent = path2row[path]
+        counts[parent] += int(l_vals[0])
+    if k_file is not filename:
+        k_file.close()
+    return TaxaTree(names, levels, parents, depths, counts)
+
+#read_taxonomy
+#usage: reads a make_ktaxonomy.py taxonomy file (once per file, shared with
+#   other programs in the same process: see kraken_cache.py)
+#returns: dictionaries of the parent and depth of each taxid
+def read_taxonomy(tax_file):
+    [taxid2parent, taxid2rank, taxid2depth, taxid2name] = kraken_cache.read_taxonomy(tax_file)
+    return [taxid2parent, taxid2depth]
+
+#load_tree
+#usage: returns the tree of taxa for a kraken report ('kreport') or krona
+#   file ('krona'), shared with other programs in the same process when
+#   reports are kept (see kraken_cache.py)
+def load_tree(filename, filetype):
+    if filetype == 'krona':
+        return kraken_cache.load(filename, 'krona', read_krona)
+    return kraken_cache.load(filename, 'kreport', read_kreport)
@@ -29,12 +29,21 @@
 #Parameters:
 #   -h, --help................show help message.
 #   -r X, --report-file X.....all input kraken reports (separated by spaces)
+#                             [may include reports previously combined by this program]
 #   -o X, --output X..........output kraken report filename
 #   --display-headers.........includes header lines mapping samples to abbreviated names
 #                             [default:true]
 #   --no-headers..............do not include header lines [default:false] 
 #   --sample-names............sample names for each kraken report (separated by spaces)
 #                             [if none are given, each sample is given names S1, S2, etc] 
+#                             [one name per sample, including each sample of a combined report]
+#   --only-combined...........include only the total combined read columns
+#   --matrix-output X.........also write the taxa x samples read count matrix
+#                             [*.npz = numpy archive, otherwise tab-delimited]
+#   --threads X...............number of processes used to read reports [default: 1]
+#   --min-count X.............only print taxa with at least X total reads [default: 0]
+#   --top-k X.................only print the X taxa with the most total reads
+#                             at each level [default: 0 = all]
 #Each Input report file format (tab-delimited)
 #   - percentage of total reads
 #   - number of reads (including reads within subtree)
@@ -53,26 +62,37 @@
 #Methods 
 #   - main
 #   - process_kraken_report
+#   - read_report
+#   - merge_report
+#   - fill_matrix
+#   - interleave
+#   - prune_rows
+#   - order_rows
+#   - write_matrix
+#   - combine_reports
+#Classes
+#   - Tree
+#   - CombinedReport
 ####################################################################
 import os, sys, argparse
 import operator
+import multiprocessing
 from time import gmtime 
 from time import strftime 
+import numpy as np
 
 #Tree Class 
 #usage: tree node used in constructing a taxonomy tree
 #   including only the taxonomy levels and genomes identified in the Kraken report
+#   read counts for each node are stored in row [row] of the sample matrices
 class Tree(object):
     'Tree node.'
-    def __init__(self, name, taxid, level_num, level_id, all_reads, lvl_reads, children=None, parent=None):
+    def __init__(self, name, taxid, level_num, level_id, row, children=None, parent=None):
         self.name = name
         self.taxid = taxid
         self.level_num = level_num
         self.level_id = level_id
-        self.tot_all = all_reads
-        self.tot_lvl = lvl_reads
-        self.all_reads = {}
-        self.lvl_reads = {}
+        self.row = row
         self.children = []
         self.parent = parent
         if children is not None:
@@ -81,13 +101,6 @@ class Tree(object):
     def add_child(self,node):
         assert isinstance(node,Tree)
         self.children.append(node)
-    def add_reads(self, sample, all_reads, lvl_reads):
-        self.all_reads[sample] = all_reads
-        self.lvl_reads[sample] = lvl_reads
-        self.tot_all += all_reads
-        self.tot_lvl += lvl_reads
-    def __lt__(self,other):
-        return self.tot_all < other.tot_all
          
 ####################################################################
 #process_kraken_report
@@ -144,9 +157,385 @@ def process_kraken_report(curr_str):
     level_num = int(spaces/2)
     return [name, taxid, level_num, level_type, all_reads, level_reads]
     
+####################################################################
+#read_report
+#usage: parses a single kraken report into a compact table of its taxa
+#   (run independently for each report, possibly in a separate process)
+#input: kraken report filename, or a report previously combined by this
+#   program (per-sample columns are found from the headers, or without
+#   headers from the number of columns)
+#   [report lines can be given instead of reading the file, e.g. from 
+#   make_kreport.py, with the filename only used to label the sample]
+#returns:
+#   - list of [sample name, original filename] for each sample in the report
+#       (sample name is empty for a single kraken report)
+#   - unclassified reads per sample
+#   - total reads per sample
+#   - integer array with one row per taxon (in report order):
+#       taxid, parent taxid, level number
+#   - integer arrays of all reads and level reads (taxa x samples)
+#   - list of level IDs (U, -, D, P, C, O, F, G, S) per taxon
+#   - list of names per taxon
+def read_report(r_file, lines=None):
+    map_lvls = {'kingdom':'K', 'superkingdom':'D','phylum':'P','class':'C','order':'O','family':'F','genus':'G','species':'S'}
+    r_samples = []
+    num_cols = 0
+    u_mask = []
+    nums = []
+    counts = []
+    level_ids = []
+    names = []
+    curr_path = []
+    if lines is None:
+        curr_file = open(r_file,'r')
+    else:
+        curr_file = lines
+    for line in curr_file: 
+        #Combined report headers
+        if line[0] == '#':
+            l_vals = line.rstrip('\r\n').split('\t')
+            if l_vals[0:3] == ['#perc','tot_all','tot_lvl']:
+                num_cols = int((len(l_vals) - 6)/2)
+            elif len(l_vals) == 2:
+                r_samples.append([l_vals[0][1:], l_vals[1]])
+            continue
+        report_vals = process_kraken_report(line)
+        if len(report_vals) < 5:
+            continue
+        [name, taxid, level_num, level_id, all_reads, level_reads] = report_vals
+        if level_id in map_lvls:
+            level_id = map_lvls[level_id]
+        #Combined reports without headers: sample columns (all/level reads)
+        #   are between the totals and the level ID, and add up to the totals
+        if len(counts) == 0 and num_cols == 0:
+            cols = line.strip().split('\t')[3:-3]
+            if len(cols) >= 4 and len(cols) % 2 == 0 and all([val.isdigit() for val in cols]):
+                if sum([int(val) for val in cols[0::2]]) == all_reads:
+                    num_cols = int(len(cols)/2)
+        #Reads for each sample in this report
+        if num_cols > 0:
+            counts.append([int(val) for val in line.strip().split('\t')[3:3+2*num_cols]])
+        else:
+            counts.append([all_reads, level_reads])
+        #Unclassified 
+        if level_id == 'U' or taxid == 0:
+            u_mask.append(True)
+            continue
+        u_mask.append(False)
+        #Tree Root 
+        if taxid == 1:
+            p_taxid = 0
+            curr_path = []
+        else:
+            #Move to correct parent
+            while level_num != (curr_path[-1][0] + 1):
+                curr_path.pop()
+            p_taxid = curr_path[-1][1]
+        curr_path.append([level_num, taxid])
+        nums.append([taxid, p_taxid, level_num])
+        level_ids.append(level_id)
+        names.append(name)
+    if lines is None:
+        curr_file.close()
+    #Split counts into all/level reads per sample
+    if num_cols == 0:
+        r_samples = [["", r_file]]
+    elif len(r_samples) != num_cols:
+        r_samples = [["", r_file] for i in range(num_cols)]
+    counts = np.array(counts, dtype=np.int64).reshape(-1, 2*len(r_samples))
+    u_mask = np.array(u_mask, dtype=bool)
+    u_reads = counts[u_mask,1::2].sum(axis=0)
+    total_reads = counts[:,1::2].sum(axis=0)
+    return [r_samples, u_reads, total_reads, np.array(nums, dtype=np.int64).reshape(-1,3),
+        counts[~u_mask,0::2], counts[~u_mask,1::2], level_ids, names]
+####################################################################
+#merge_report
+#usage: adds the taxa of one parsed report to the combined tree
+#input:
+#   - taxa table (taxid, parent taxid, level number), level IDs and names
+#       as returned by read_report
+#   - dictionary of taxid to tree node (updated with new nodes)
+#   - list of tree nodes indexed by matrix row (updated with new nodes)
+#returns: array with the matrix row of each taxon in the report
+def merge_report(nums, level_ids, names, taxid2node, row2node):
+    main_lvls = ['U','R','D','K','P','C','O','F','G','S']
+    rows = []
+    for [i, vals] in enumerate(nums.tolist()):
+        [taxid, p_taxid, level_num] = vals[0:3]
+        #IF NODE EXISTS 
+        if taxid in taxid2node:
+            rows.append(taxid2node[taxid].row)
+            continue
+        #OTHERWISE
+        if taxid == 1:
+            curr_node = Tree(names[i], taxid, level_num, 'R', len(row2node))
+        else:
+            prev_node = taxid2node[p_taxid]
+            #Determine correct level ID
+            level_id = level_ids[i]
+            if level_id == '-' or len(level_id)> 1:
+                if prev_node.level_id in main_lvls:
+                    level_id = prev_node.level_id + '1'
+                else:
+                    num = int(prev_node.level_id[-1]) + 1
+                    level_id = prev_node.level_id[:-1] + str(num)
+            #Add node to tree
+            curr_node = Tree(names[i], taxid, level_num, level_id, len(row2node), None, prev_node)
+            prev_node.add_child(curr_node)
+        taxid2node[taxid] = curr_node
+        row2node.append(curr_node)
+        rows.append(curr_node.row)
+    return np.array(rows, dtype=np.int64)
+####################################################################
+#fill_matrix
+#usage: builds a taxa x samples matrix from the rows/values found in each sample
+#input: 
+#   - number of taxa (rows)
+#   - list with one array of row indices per sample
+#   - list with one array of values per sample
+#returns: integer matrix with 0 for taxa not found in a sample
+def fill_matrix(num_rows, sample_rows, sample_vals):
+    matrix = np.zeros((num_rows, len(sample_rows)), dtype=np.int64)
+    for s in range(len(sample_rows)):
+        matrix[sample_rows[s], s] = sample_vals[s]
+    return matrix
+####################################################################
+#interleave
+#usage: merges two taxa x samples matrices into the report column order
+#   S1_all, S1_lvl, S2_all, S2_lvl, ...etc
+def interleave(all_reads, lvl_reads):
+    both = np.empty((all_reads.shape[0], 2*all_reads.shape[1]), dtype=np.int64)
+    both[:,0::2] = all_reads
+    both[:,1::2] = lvl_reads
+    return both
+####################################################################
+#prune_rows
+#usage: determines which taxa to print in the combined report
+#input:
+#   - list of tree nodes indexed by matrix row
+#   - total reads (all samples) rooted at each taxon
+#   - minimum total reads for a taxon to be printed
+#   - maximum number of taxa to print for each level ID (0 = no maximum)
+#returns: boolean array (True = print taxon)
+#   taxa of the same level ID are ranked by total reads (ties by taxid)
+def prune_rows(row2node, tot_all, min_count, top_k):
+    keep = tot_all >= min_count
+    if top_k > 0:
+        taxids = np.array([node.taxid for node in row2node], dtype=np.int64)
+        [lvls, codes] = np.unique([node.level_id for node in row2node], return_inverse=True)
+        idx = np.lexsort((taxids, -tot_all, codes))
+        #Position of each taxon within its level ID
+        sorted_codes = codes[idx]
+        rank = np.arange(len(idx)) - np.searchsorted(sorted_codes, sorted_codes, side='left')
+        in_top = np.zeros(len(idx), dtype=bool)
+        in_top[idx] = rank < top_k
+        keep &= in_top
+    #Always print the tree root
+    for node in row2node:
+        if node.parent is None:
+            keep[node.row] = True
+    return keep
+####################################################################
+#order_rows
+#usage: determines the order in which taxa are printed (depth-first, 
+#   with children in decreasing order of total reads, ties by taxid)
+#   children of all nodes are ordered with a single sort
+#input:
+#   - list of tree nodes indexed by matrix row
+#   - total reads (all samples) rooted at each taxon
+#   - boolean array of taxa to print (subtrees of other taxa are skipped)
+#returns: array of matrix rows in print order
+def order_rows(row2node, tot_all, keep):
+    taxids = np.array([node.taxid for node in row2node], dtype=np.int64)
+    parents = np.array([-1 if node.parent is None else node.parent.row for node in row2node], dtype=np.int64)
+    idx = np.lexsort((taxids, -tot_all, parents))
+    #Children of each row, in print order
+    children = [[] for node in row2node]
+    for [row, parent] in zip(idx.tolist(), parents[idx].tolist()):
+        if parent >= 0 and keep[row]:
+            children[parent].append(row)
+    order = []
+    all_rows = [root.row for root in row2node if root.parent is None]
+    all_rows.reverse()
+    while len(all_rows) > 0:
+        #Remove row and insert children
+        row = all_rows.pop()
+        order.append(row)
+        all_rows.extend(reversed(children[row]))
+    return np.array(order, dtype=np.int64)
+####################################################################
+#write_matrix
+#usage: writes the combined taxa x samples read counts for downstream analysis
+#input:
+#   - output filename (*.npz = numpy binary archive, otherwise tab-delimited)
+#   - list of tree nodes, indexed by matrix row
+#   - list of sample names
+#   - taxa x samples matrices of clade and level read counts
+#returns: none
+def write_matrix(out_file, row2node, names, all_reads, lvl_reads):
+    if out_file.endswith('.npz'):
+        np.savez_compressed(out_file,
+            taxid=np.array([node.taxid for node in row2node], dtype=np.int64),
+            lvl_type=np.array([node.level_id for node in row2node]),
+            name=np.array([node.name for node in row2node]),
+            samples=np.array(names),
+            all_reads=all_reads, lvl_reads=lvl_reads)
+        return
+    o_file = open(out_file,'w')
+    header = "taxid\tlvl_type\tname"
+    for name in names:
+        header += "\t%s_all\t%s_lvl" % (name, name)
+    o_file.write(header + "\n")
+    both = interleave(all_reads, lvl_reads).tolist()
+    o_file.writelines(["%s\t%s\t%s\t%s\n" % (node.taxid, node.level_id, node.name,
+        "\t".join(map(str, both[node.row]))) for node in row2node])
+    o_file.close()
+    
+####################################################################
+#CombinedReport Class
+#usage: combined kraken report, built by adding one parsed report at a time
+#   and written with two columns (all/level reads) per sample. Read counts
+#   are kept as taxa x samples numpy matrices (rows indexed by tree node)
+class CombinedReport(object):
+    'Combined kraken report.'
+    def __init__(self):
+        self.taxid2node = {}
+        self.row2node = []
+        #Map sample number to name/filename
+        self.id2names = {}
+        self.id2files = {}
+        self.used_names = set()
+        self.u_reads = []
+        self.total_reads = []
+        #Matrix rows/values found in each sample
+        self.sample_rows = []
+        self.sample_all = []
+        self.sample_lvl = []
+        self.printed = 0
+    #add_report
+    #usage: adds a parsed report (as returned by read_report); previously
+    #   combined reports contribute one sample per column pair
+    def add_report(self, report):
+        [r_samples, r_u_reads, r_total_reads, nums, r_all, r_lvl, level_ids, names] = report
+        rows = merge_report(nums, level_ids, names, self.taxid2node, self.row2node)
+        for [j, [name, r_file]] in enumerate(r_samples):
+            count_samples = len(self.id2names) + 1
+            #Keep given names, renumber default names (S1, S2, etc) 
+            if name == "" or name == ("S" + str(j+1)):
+                name = "S" + str(count_samples)
+            #Names must be unique (a kept name may equal a renumbered one)
+            if name in self.used_names:
+                k = 2
+                while name + "_" + str(k) in self.used_names:
+                    k += 1
+                name = name + "_" + str(k)
+            self.used_names.add(name)
+            self.id2names[count_samples] = name
+            self.id2files[count_samples] = r_file
+            self.u_reads.append(r_u_reads[j])
+            self.total_reads.append(r_total_reads[j])
+            self.sample_rows.append(rows)
+            self.sample_all.append(r_all[:,j])
+            self.sample_lvl.append(r_lvl[:,j])
+    #num_samples
+    def num_samples(self):
+        return len(self.id2names)
+    #set_names
+    #usage: replaces the sample names (one per sample)
+    def set_names(self, sample_names):
+        for i in range(self.num_samples()):
+            self.id2names[i+1] = sample_names[i]
+        self.used_names = set(sample_names)
+    #names
+    #usage: returns the list of sample names
+    def names(self):
+        return [self.id2names[i+1] for i in range(self.num_samples())]
+    #matrices
+    #usage: returns the taxa x samples matrices of all reads and level reads
+    #   (rows indexed by tree node, 0 for taxa not found in a sample)
+    def matrices(self):
+        return [fill_matrix(len(self.row2node), self.sample_rows, self.sample_all),
+            fill_matrix(len(self.row2node), self.sample_rows, self.sample_lvl)]
+    #lines
+    #usage: generates the lines of the combined report (header lines, the
+    #   unclassified line, then the tree formatting each chunk of lines in bulk)
+    #input:
+    #   - headers: include header lines mapping samples to names/files
+    #   - c_only: include only the total combined read columns
+    #   - min_count, top_k: prune taxa as in prune_rows
+    #   - chunk_size: number of lines formatted at once
+    #   - matrices: [all reads, level reads] (if already calculated)
+    #returns: combined report lines (generator); the number of taxa printed
+    #   is saved as self.printed
+    def lines(self, headers=True, c_only=False, min_count=0, top_k=0, chunk_size=100000, matrices=None):
+        if matrices is None:
+            matrices = self.matrices()
+        [all_reads, lvl_reads] = matrices
+        id2names = self.id2names
+        row2node = self.row2node
+        u_reads = np.array(self.u_reads, dtype=np.int64)
+        total_reads = np.array(self.total_reads, dtype=np.int64)
+        #Lines mapping sample ids to filenames
+        if headers: 
+            yield "#Number of Samples: %i\n" % self.num_samples()
+            yield "#Total Number of Reads: %i\n" % total_reads.sum()
+            for i in id2names:
+                yield "#%s\t%s\n" % (id2names[i], self.id2files[i])
+            #Report columns
+            header = "#perc\ttot_all\ttot_lvl"
+            if not c_only:
+                for i in id2names:
+                    header += "\t%s_all\t%s_lvl" % (id2names[i], id2names[i])
+            yield header + "\tlvl_type\ttaxid\tname\n"
+        tot_reads = float(total_reads.sum())
+        tot_all = all_reads.sum(axis=1)
+        tot_lvl = lvl_reads.sum(axis=1)
+        #Line for unclassified reads
+        u_line = "%0.4f\t%i\t%i\t" % (float(u_reads.sum())/tot_reads*100, u_reads.sum(), u_reads.sum())
+        if not c_only:
+            u_line += "".join(["%i\t%i\t" % (u, u) for u in u_reads.tolist()])
+        yield u_line + "U\t0\tunclassified\n"
+        #Determine order of all remaining nodes
+        keep = prune_rows(row2node, tot_all, min_count, top_k)
+        order = order_rows(row2node, tot_all, keep)
+        self.printed = len(order)
+        #Lines for all remaining reads, formatting each chunk of lines in bulk
+        for start in range(0, len(order), chunk_size):
+            chunk = order[start:start+chunk_size]
+            perc = (tot_all[chunk]/tot_reads*100).tolist()
+            chunk_all = tot_all[chunk].tolist()
+            chunk_lvl = tot_lvl[chunk].tolist()
+            if c_only:
+                sample_cols = [""]*len(chunk)
+            else:
+                sample_cols = ["\t".join(map(str, row)) + "\t" for row in interleave(all_reads[chunk], lvl_reads[chunk]).tolist()]
+            for [i, row] in enumerate(chunk.tolist()):
+                curr_node = row2node[row]
+                yield "%0.4f\t%i\t%i\t%s%s\t%s\t%s%s\n" % (perc[i], chunk_all[i], chunk_lvl[i],
+                    sample_cols[i], curr_node.level_id, curr_node.taxid, " "*curr_node.level_num*2, curr_node.name)
+
+####################################################################
+#combine_reports
+#usage: combines kraken reports in memory
+#input: 
+#   - list of kraken reports, each a filename or a list of report lines
+#       (e.g. from make_kreport.py)
+#   - sample names [default: S1, S2, etc]
+#returns: CombinedReport
+def combine_reports(reports, sample_names=[]):
+    combined = CombinedReport()
+    for report in reports:
+        if isinstance(report, str):
+            combined.add_report(read_report(report))
+        else:
+            combined.add_report(read_report("", report))
+    if len(sample_names) > 0:
+        combined.set_names(sample_names)
+    return combined
+
 ####################################################################
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-r','--report-file','--report-files',
@@ -165,162 +554,74 @@ def main():
     parser.add_argument('--only-combined', required=False, dest='c_only',
         action='store_true', default=False, 
         help='Include only the total combined reads column, not the individual sample cols')
-    args=parser.parse_args()
+    parser.add_argument('--matrix-output', required=False, dest='matrix_output',
+        default='', help='Also write the taxa x samples read counts to this file \
+        (*.npz for a numpy archive, otherwise tab-delimited)')
+    parser.add_argument('--threads', required=False, dest='threads',
+        default=1, type=int, help='Number of processes used to read reports [default: 1]')
+    parser.add_argument('--min-count', required=False, dest='min_count',
+        default=0, type=int, help='Only print taxa with at least this many total reads [default: 0]')
+    parser.add_argument('--top-k', required=False, dest='top_k',
+        default=0, type=int, help='Only print the K taxa with the most total reads \
+        at each level (U, R, D, P, C, O, F, G, S, G1, etc) [default: 0 = all]')
+    args=parser.parse_args(argv)
     
 
-    #Initialize combined values 
-    main_lvls = ['U','R','D','K','P','C','O','F','G','S']
-    map_lvls = {'kingdom':'K', 'superkingdom':'D','phylum':'P','class':'C','order':'O','family':'F','genus':'G','species':'S'}
-    count_samples = 0
-    num_samples = len(args.r_files)
+    #Initialize combined report
+    count_reports = 0
+    num_reports = len(args.r_files)
     sample_names = args.s_names
-    root_node = -1 
-    prev_node = -1
-    curr_node = -1
-    u_reads = {0:0} 
-    total_reads = {0:0} 
-    taxid2node = {}
-
-    #Check input values 
-    if len(sample_names) > 0 and len(sample_names) != num_samples: 
-        sys.stderr.write("Number of sample names provided does not match number of reports\n")
-        sys.exit(1)
-    #Map names
-    id2names = {} 
-    id2files = {} 
-    if len(sample_names) == 0:
-        for i in range(num_samples):
-            id2names[i+1] = "S" + str(i+1)
-            id2files[i+1] = ""
-    else:
-        for i in range(num_samples):
-            id2names[i+1] = sample_names[i] 
-            id2files[i+1] = ""
+    combined = CombinedReport()
     
     #################################################
     #STEP 1: READ IN REPORTS
-    #Iterate through reports and make combined tree! 
+    #Parse reports (in parallel if requested) and merge into combined tree! 
     sys.stdout.write(">>STEP 1: READING REPORTS\n")
-    sys.stdout.write("\t%i/%i samples processed" % (count_samples, num_samples))
+    sys.stdout.write("\t%i/%i reports processed" % (count_reports, num_reports))
     sys.stdout.flush()
-    for r_file in args.r_files:
-        count_samples += 1 
-        sys.stdout.write("\r\t%i/%i samples processed" % (count_samples, num_samples))
+    if args.threads > 1:
+        pool = multiprocessing.Pool(args.threads)
+        reports = pool.imap(read_report, args.r_files, chunksize=max(1, int(num_reports/(args.threads*16))))
+    else:
+        pool = None
+        reports = map(read_report, args.r_files)
+    for report in reports:
+        count_reports += 1 
+        sys.stdout.write("\r\t%i/%i reports processed" % (count_reports, num_reports))
         sys.stdout.flush()
-        id2files[count_samples] = r_file
-        #Open File 
-        curr_file = open(r_file,'r')
-        for line in curr_file: 
-            report_vals = process_kraken_report(line)
-            if len(report_vals) < 5:
-                continue
-            [name, taxid, level_num, level_id, all_reads, level_reads] = report_vals
-            if level_id in map_lvls:
-                level_id = map_lvls[level_id]
-            #Total reads 
-            total_reads[0] += level_reads
-            total_reads[count_samples] = level_reads 
-            #Unclassified 
-            if level_id == 'U' or taxid == '0':
-                u_reads[0] += level_reads
-                u_reads[count_samples] = level_reads 
-                continue
-            #Tree Root 
-            if taxid == 1: 
-                if count_samples == 1:
-                    root_node = Tree(name, taxid, level_num, 'R', 0,0)
-                    taxid2node[taxid] = root_node 
-                root_node.add_reads(count_samples, all_reads, level_reads) 
-                prev_node = root_node
-                continue 
-            #Move to correct parent
-            while level_num != (prev_node.level_num + 1):
-                prev_node = prev_node.parent
-            #IF NODE EXISTS 
-            if taxid in taxid2node: 
-                taxid2node[taxid].add_reads(count_samples, all_reads, level_reads) 
-                prev_node = taxid2node[taxid]
-                continue 
-            #OTHERWISE
-            #Determine correct level ID
-            if level_id == '-' or len(level_id)> 1:
-                if prev_node.level_id in main_lvls:
-                    level_id = prev_node.level_id + '1'
-                else:
-                    num = int(prev_node.level_id[-1]) + 1
-                    level_id = prev_node.level_id[:-1] + str(num)
-            #Add node to tree
-            curr_node = Tree(name, taxid, level_num, level_id, 0, 0, None, prev_node)
-            curr_node.add_reads(count_samples, all_reads, level_reads)
-            taxid2node[taxid] = curr_node
-            prev_node.add_child(curr_node)
-            prev_node = curr_node 
-        curr_file.close()
+        combined.add_report(report)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    num_samples = combined.num_samples()
 
-    sys.stdout.write("\r\t%i/%i samples processed\n" % (count_samples, num_samples))
+    sys.stdout.write("\r\t%i/%i reports processed (%i samples)\n" % (count_reports, num_reports, num_samples))
     sys.stdout.flush()
 
+    #Check input values 
+    if len(sample_names) > 0:
+        if len(sample_names) != num_samples: 
+            sys.stderr.write("Number of sample names provided does not match number of samples\n")
+            sys.exit(1)
+        combined.set_names(sample_names)
+    #Fill taxa x samples matrices
+    [all_reads, lvl_reads] = combined.matrices()
+    if args.matrix_output != '':
+        sys.stdout.write(">>WRITING TAXA x SAMPLES MATRIX TO %s\n" % args.matrix_output)
+        write_matrix(args.matrix_output, combined.row2node, combined.names(), all_reads, lvl_reads)
+
     #################################################
     #STEP 2: SETUP OUTPUT FILE
     sys.stdout.write(">>STEP 2: WRITING NEW REPORT HEADERS\n")
     o_file = open(args.output,'w') 
-    #Lines mapping sample ids to filenames
-    if args.headers: 
-        o_file.write("#Number of Samples: %i\n" % num_samples) 
-        o_file.write("#Total Number of Reads: %i\n" % total_reads[0])
-        for i in id2names:
-            o_file.write("#")
-            o_file.write("%s\t" % id2names[i])
-            o_file.write("%s\n" % id2files[i])
-        #Report columns
-        o_file.write("#perc\ttot_all\ttot_lvl")
-        if not args.c_only:
-            for i in id2names:
-                o_file.write("\t%s_all" % id2names[i])
-                o_file.write("\t%s_lvl" % id2names[i])
-        o_file.write("\tlvl_type\ttaxid\tname\n")
     #################################################
     #STEP 3: PRINT TREE
     sys.stdout.write(">>STEP 3: PRINTING REPORT\n")
-    #Print line for unclassified reads
-    o_file.write("%0.4f\t" % (float(u_reads[0])/float(total_reads[0])*100))
-    for i in range(num_samples+1):
-        if i == 0 or (i > 0 and not args.c_only):
-            if i not in u_reads:
-                o_file.write("0\t")
-                o_file.write("0\t")
-            else:
-                o_file.write("%i\t" % u_reads[i])
-                o_file.write("%i\t" % u_reads[i])
-    o_file.write("U\t0\tunclassified\n")
-    #Print for all remaining reads 
-    all_nodes = [root_node]
-    curr_node = -1
-    curr_lvl = 0
-    prev_node = -1
-    while len(all_nodes) > 0:
-        #Remove node and insert children
-        curr_node = all_nodes.pop()
-        if len(curr_node.children) > 0:
-            curr_node.children.sort()
-            for node in curr_node.children:
-                all_nodes.append(node)
-        #Print information for this node 
-        o_file.write("%0.4f\t" % (float(curr_node.tot_all)/float(total_reads[0])*100))
-        o_file.write("%i\t" % curr_node.tot_all)
-        o_file.write("%i\t" % curr_node.tot_lvl)
-        if not args.c_only:
-            for i in range(num_samples):
-                if (i+1) not in curr_node.all_reads: 
-                    o_file.write("0\t0\t")
-                else:
-                    o_file.write("%i\t" % curr_node.all_reads[i+1])
-                    o_file.write("%i\t" % curr_node.lvl_reads[i+1])
-        o_file.write("%s\t" % curr_node.level_id)
-        o_file.write("%s\t" % curr_node.taxid)
-        o_file.write(" "*curr_node.level_num*2)
-        o_file.write("%s\n" % curr_node.name)
+    o_file.writelines(combined.lines(args.headers, args.c_only, args.min_count, 
+        args.top_k, matrices=[all_reads, lvl_reads]))
     o_file.close() 
+    if combined.printed < len(combined.row2node):
+        sys.stdout.write("\t%i/%i taxa printed (remaining taxa pruned)\n" % (combined.printed, len(combined.row2node)))
 ####################################################################
 if __name__ == "__main__":
     main()
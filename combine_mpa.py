@@ -43,17 +43,206 @@
 #       (traditional levels: domain, kingdom, phylum, class, order, 
 #       family, genus, species)
 #       [Default: no intermediate ranks]
+#   - normalize = prints percentages of the top-level classifications in each
+#       sample (their total, not the total classified reads: reads at the
+#       root are not in mpa-style files)
+#   - min-prevalence = only prints classifications found in at least this
+#       fraction of samples
+#   - rank = only prints classifications at the given levels [d,k,p,c,o,f,g,s,x]
 #Output file format (tab-delimited)
 #   - Taxonomy tree levels |-delimited, with level type [d,k,p,c,o,f,g,s,x]
 #   - Number of reads within subtree of the specified level
 #
 #Methods
+#   - float_str
+#   - int_str
 #   - main
+#Classes
+#   - CombinedMpa
 #
 import os, sys, argparse
+import numpy as np
+
+#float_str/int_str
+#usage: formats a float/integer value of the (float) combined matrix,
+#   printing 0 for classifications not found in the sample (NaN)
+def float_str(val):
+    return "0" if val != val else str(val)
+def int_str(val):
+    return "0" if val != val else str(int(val))
+
+#CombinedMpa Class
+#usage: combined mpa-style table, built by adding one sample at a time
+#   and written with one column per sample. Values are kept in a 
+#   classification x sample numpy matrix (rows indexed by classification)
+class CombinedMpa(object):
+    'Combined mpa-style report.'
+    def __init__(self):
+        self.samples = {} #Map number to name
+        self.sample_count = 0 
+        self.names = [] #Map row to taxon tree
+        self.index = {} #Map taxon tree to row
+        self.parent2child = {} #Map row to child rows (ordered, as dict keys)
+        self.toparse = []
+        #Rows/values found in each sample
+        self.sample_rows = []
+        self.sample_vals = []
+        self.sample_float = [] #Whether each sample has float values (percentages)
+        #Prefix tree of taxon tree levels:
+        #   level -> [levels below, row if the path up to this level is a taxon tree, otherwise -1]
+        self.levels = {}
+    #add_sample
+    #usage: adds the lines of one mpa-style report as a new sample
+    #input: mpa-style lines, sample name [default: from the header line,
+    #   otherwise "Sample #1", "Sample #2", etc]
+    def add_sample(self, lines, sample_name=''):
+        index = self.index
+        self.sample_count += 1
+        sample_count = self.sample_count
+        if sample_name == '':
+            sample_name = "Sample #" + str(sample_count) 
+        rows = []
+        vals = []
+        is_float = False
+        for line in lines:
+            #Check for header line 
+            if line[0] == "#":
+                sample_name = line.strip().split('\t')[-1]
+                continue 
+            #Otherwise
+            [classification, val] = line.strip().split('\t')
+            if classification not in index:
+                self.add_classification(classification)
+            #Save classification row and value
+            rows.append(index[classification])
+            try:
+                vals.append(int(val))
+            except ValueError:
+                vals.append(float(val))
+                is_float = True
+        self.sample_rows.append(np.array(rows, dtype=np.int64))
+        self.sample_vals.append(vals)
+        self.sample_float.append(is_float)
+        #Save sample name 
+        self.samples[sample_count] = sample_name 
+    #add_classification
+    #usage: adds a new taxon tree below its most specific parent taxon tree
+    #   (following the prefix tree one level at a time)
+    def add_classification(self, classification):
+        split_vals = classification.split("|")
+        row = len(self.names)
+        #Check for parents
+        curr_parent = -1
+        curr_levels = self.levels
+        for i in range(0, len(split_vals) - 1):
+            if split_vals[i] not in curr_levels:
+                break
+            [curr_levels, level_row] = curr_levels[split_vals[i]]
+            if level_row >= 0:
+                curr_parent = level_row
+        #No parent
+        if curr_parent == -1:
+            self.toparse.append(row) 
+        #Most specific parent found 
+        else:
+            if curr_parent not in self.parent2child:
+                self.parent2child[curr_parent] = {}
+            self.parent2child[curr_parent][row] = True
+        #Save levels to prefix tree
+        curr_levels = self.levels
+        for val in split_vals[:-1]:
+            if val not in curr_levels:
+                curr_levels[val] = [{}, -1]
+            curr_levels = curr_levels[val][0]
+        if split_vals[-1] not in curr_levels:
+            curr_levels[split_vals[-1]] = [{}, row]
+        else:
+            curr_levels[split_vals[-1]][1] = row
+        self.names.append(classification)
+        self.index[classification] = row
+    #matrix
+    #usage: returns the classification x sample matrix of values
+    #   (integers if all samples have read counts; otherwise floats, with NaN
+    #   for classifications not found in a sample)
+    def matrix(self):
+        if any(self.sample_float):
+            matrix = np.full((len(self.names), self.sample_count), np.nan)
+        else:
+            matrix = np.zeros((len(self.names), self.sample_count), dtype=np.int64)
+        for i in range(self.sample_count):
+            matrix[self.sample_rows[i], i] = self.sample_vals[i]
+        return matrix
+    #order
+    #usage: returns all rows in output order (each classification followed
+    #   by its children, in reverse order)
+    def order(self):
+        toparse = [iter(self.toparse)]
+        order = []
+        while len(toparse) > 0:
+            row = next(toparse[-1], -1)
+            if row == -1:
+                toparse.pop()
+                continue
+            order.append(row)
+            #Add all children to stack 
+            if row in self.parent2child: 
+                toparse.append(reversed(self.parent2child[row]))
+        return np.array(order, dtype=np.int64)
+    #write
+    #usage: writes the combined table (header line, then each classification
+    #   followed by its children) 
+    #input: 
+    #   - output file
+    #   - normalize: print percentages of the total of the top-level classifications
+    #       in each sample
+    #   - min_prevalence: only print classifications found (value > 0) in at
+    #       least this fraction of samples
+    #   - ranks: only print classifications at these levels (d, k, p, ..., s, x)
+    #       [default: all levels]
+    #Without normalize, each sample column is printed as integers (read counts)
+    #   or floats (percentages), as read for that sample
+    def write(self, o_file, normalize=False, min_prevalence=0.0, ranks=None):
+        samples = range(1, self.sample_count+1)
+        matrix = self.matrix()
+        values = np.nan_to_num(matrix)
+        #Filter and normalize values
+        keep = np.ones(len(self.names), dtype=bool)
+        if min_prevalence > 0:
+            keep &= ((values > 0).sum(axis=1) >= min_prevalence*self.sample_count)
+        if ranks:
+            lvls = np.array([name.rsplit("|", 1)[-1].split("__", 1)[0] for name in self.names])
+            keep &= np.isin(lvls, ranks)
+        if normalize:
+            totals = values[self.toparse].sum(axis=0)
+            matrix = np.divide(values*100.0, totals, out=np.zeros(values.shape), where=(totals > 0))
+        order = self.order()
+        order = order[keep[order]]
+        sys.stdout.write(" Number of classifications to write: %i\n" % len(order))
+        sys.stdout.write("\t%i classifications printed" % 0)
+        #Write header
+        o_file.write("#Classification\t" + "\t".join([self.samples[i] for i in samples]) + "\n")
+        
+        #Write each line, formatting each chunk of lines in bulk
+        if any(self.sample_float):
+            formats = [float_str if is_float else int_str for is_float in self.sample_float]
+        count_c = 0 
+        for start in range(0, len(order), 10000):
+            chunk = order[start:start+10000]
+            if normalize:
+                vals = [["%0.6f" % val for val in row] for row in matrix[chunk].tolist()]
+            elif any(self.sample_float):
+                vals = [[f(val) for [f, val] in zip(formats, row)] for row in matrix[chunk].tolist()]
+            else:
+                vals = [map(str, row) for row in matrix[chunk].tolist()]
+            o_file.writelines([self.names[row] + "\t" + "\t".join(vals[i]) + "\n" for [i, row] in enumerate(chunk.tolist())])
+            count_c += len(chunk)
+            sys.stdout.write("\r\t%i classifications printed" % count_c)
+            sys.stdout.flush()
+        sys.stdout.write("\r\t%i classifications printed\n" % count_c)
+        sys.stdout.flush()
 
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', required=True,
@@ -61,82 +250,29 @@ def main():
         help='Input files for this program (files generated by kreport2mpa.py)')
     parser.add_argument('-o', '--output', required=True,
         dest='o_file', help='Single mpa-report file name')
-    args=parser.parse_args()
+    parser.add_argument('--normalize', action='store_true',
+        dest='normalize', default=False, required=False,
+        help='Print percentages of the top-level classifications in each sample [default: input values]')
+    parser.add_argument('--min-prevalence', required=False, type=float,
+        dest='min_prevalence', default=0.0,
+        help='Only print classifications found in at least this fraction of samples [default: 0]')
+    parser.add_argument('--rank', '--ranks', required=False, nargs='+',
+        dest='ranks', default=[], choices=['d','k','p','c','o','f','g','s','x'],
+        help='Only print classifications at these levels (space-delimited) [default: all]')
+    args=parser.parse_args(argv)
 
     #Process each file 
-    samples = {} #Map number to name
-    sample_count = 0 
-    values = {} #Map taxon tree to sample to number 
-    parent2child = {}
-    toparse = []
+    combined = CombinedMpa()
     sys.stdout.write(" Number of files to parse: %i\n" % len(args.in_files))
     for in_file in args.in_files:
         i_file = open(in_file,'r')
-        sample_count += 1
-        sample_name = "Sample #" + str(sample_count) 
-        for line in i_file:
-            #Check for header line 
-            if line[0] == "#":
-                sample_name = line.strip().split('\t')[-1]
-                continue 
-            #Otherwise
-            [classification, val] = line.strip().split('\t')
-            #Check for parents
-            split_vals = classification.split("|")
-            curr_parent = ''
-            for i in range(0,len(split_vals)):
-                test_val = "|".join(split_vals[0:i]) 
-                if test_val in values: 
-                    curr_parent = test_val 
-            #No parent
-            if curr_parent == '':
-                if classification not in values:
-                    toparse.append(classification) 
-            #Most specific parent found 
-            if curr_parent != '':
-                if curr_parent not in parent2child:
-                    parent2child[curr_parent] = []
-                if classification not in parent2child[curr_parent]:
-                    parent2child[curr_parent].append(classification)
-            #Save classification to value map
-            if classification not in values:
-                values[classification] = {}
-            values[classification][sample_count] = val
-        #Save sample name 
-        samples[sample_count] = sample_name 
+        combined.add_sample(i_file)
+        i_file.close()
     
-    sys.stdout.write(" Number of classifications to write: %i\n" % len(values))
-    sys.stdout.write("\t%i classifications printed" % 0)
-    #Write header
+    #Write combined file
     o_file = open(args.o_file, 'w')
-    o_file.write("#Classification") 
-    for i in range(1, sample_count+1):
-        o_file.write("\t" + samples[i])
-    o_file.write("\n") 
-    
-    #Write each line  
-    parsed = {} 
-    count_c = 0 
-    while len(toparse) > 0:
-        curr_c = toparse.pop(0)
-        #Add all children to stack 
-        if curr_c in parent2child: 
-            for child in parent2child[curr_c]: 
-                toparse.insert(0, child) 
-        #For the current classification, print per sample
-        o_file.write(curr_c) 
-        for i in range(1,sample_count + 1):
-            if i in values[curr_c]:
-                o_file.write("\t" + values[curr_c][i])
-            else:
-                o_file.write("\t0")
-        o_file.write("\n")
-        count_c += 1
-        sys.stdout.write("\r\t%i classifications printed" % count_c)
-        sys.stdout.flush()
+    combined.write(o_file, args.normalize, args.min_prevalence, args.ranks)
     o_file.close() 
-    sys.stdout.write("\r\t%i classifications printed\n" % count_c)
-    sys.stdout.flush()
 
 if __name__ == "__main__":
     main()
@@ -47,14 +47,25 @@
 #   --exclude...........................exclude the taxids specified
 # ** by default, only reads classified exactly at taxids provided will be extracted
 # ** if either of these are specified, a report file must also be provided 
+#
+#Reads can also be extracted in memory: report_taxids, find_read_ids and
+#extract_reads work on kraken report/output lines and sequence records
+#
+#Methods
+#   - main
+#   - process_kraken_output
+#   - process_kraken_report
+#   - report_taxids
+#   - find_read_ids
+#   - extract_reads
+#Classes
+#   - Tree
+#   - Progress
 ######################################################################
 import os, sys, argparse
 import gzip
 from time import gmtime
 from time import strftime
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 #################################################################################
 #Tree Class 
 #usage: tree node used in constructing taxonomy tree  
@@ -144,8 +155,152 @@ def process_kraken_report(report_line):
     level_num = int(spaces/2)
     return[taxid, level_num, level_type]
 ################################################################################
+#report_taxids
+#usage: adds the parents and/or children of taxids, as found in a kraken report
+#input: 
+#   - kraken report filename (or kraken report lines)
+#   - dictionary of taxids (values are 0)
+#   - parents: include all parents of the taxids
+#   - children: include all children of the taxids
+#returns: dictionary of taxids (given taxids with parents/children)
+def report_taxids(report_file, save_taxids, parents=False, children=False):
+    save_taxids = dict(save_taxids)
+    main_lvls = ['R','K','D','P','C','O','F','G','S']
+    #create tree and save nodes with taxids in the list 
+    base_nodes = {} 
+    if isinstance(report_file, str):
+        r_file = open(report_file,'r')
+    else:
+        r_file = report_file
+    prev_node = -1
+    for line in r_file:
+        #extract values
+        report_vals = process_kraken_report(line)
+        if len(report_vals) == 0:
+            continue
+        [taxid, level_num, level_id] = report_vals
+        if taxid == 0:
+            continue 
+        #tree root
+        if taxid == 1:
+            level_id = 'R'
+            root_node = Tree(taxid, level_num, level_id)
+            prev_node = root_node
+            #save if needed
+            if taxid in save_taxids:
+                base_nodes[taxid] = root_node
+            continue
+        #move to correct parent
+        while level_num != (prev_node.level_num + 1):
+            prev_node = prev_node.parent 
+        #determine correct level ID 
+        if level_id == '-' or len(level_id) > 1:
+            if prev_node.level_id in main_lvls:
+                level_id = prev_node.level_id + '1'
+            else:
+                num = int(prev_node.level_id[-1]) + 1
+                level_id = prev_node.level_id[:-1] + str(num)
+        #make node
+        curr_node = Tree(taxid, level_num, level_id, None, prev_node)
+        prev_node.add_child(curr_node)
+        prev_node = curr_node
+        #save if taxid matches
+        if taxid in save_taxids:
+            base_nodes[taxid] = curr_node 
+    if r_file is not report_file:
+        r_file.close()
+    #FOR SAVING PARENTS
+    if parents:
+        #For each node saved, traverse up the tree and save each taxid 
+        for tid in base_nodes:
+            curr_node = base_nodes[tid]
+            while curr_node.parent != None:
+                curr_node = curr_node.parent
+                save_taxids[curr_node.taxid] = 0
+    #FOR SAVING CHILDREN 
+    if children:
+        for tid in base_nodes:
+            curr_nodes = list(base_nodes[tid].children)
+            while len(curr_nodes) > 0:
+                #For this node
+                curr_n = curr_nodes.pop()
+                if curr_n.taxid not in save_taxids:
+                    save_taxids[curr_n.taxid] = 0
+                #Add all children
+                if curr_n.children != None:
+                    for child in curr_n.children:
+                        curr_nodes.append(child)
+    return save_taxids
+################################################################################
+#find_read_ids
+#usage: finds the read IDs classified at (or, with exclude, not at) the taxids
+#input:
+#   - kraken output lines (e.g. an open kraken output file)
+#   - dictionary of taxids
+#   - exclude: find reads NOT classified at the taxids
+#   - max_reads: stop once this many read IDs are found
+#returns: dictionary of read IDs (values are 0)
+def find_read_ids(kraken_lines, save_taxids, exclude=False, max_reads=100000000):
+    save_readids = {}
+    for line in kraken_lines:
+        #Parse line for results
+        [tax_id, read_id] = process_kraken_output(line)
+        if tax_id == -1:
+            continue
+        if (tax_id in save_taxids) != exclude:
+            save_readids[read_id] = 0 
+        if len(save_readids) >= max_reads:
+            break 
+    return save_readids
+################################################################################
+#extract_reads
+#usage: finds the reads with the given read IDs (ignoring /1 and /2 suffixes)
+#input:
+#   - sequence records (e.g. from Bio.SeqIO.parse), anything with an id
+#   - dictionary of read IDs (from find_read_ids)
+#returns: records found (generator, stops once all read IDs are found)
+def extract_reads(records, save_readids):
+    count_output = 0
+    if len(save_readids) == 0:
+        return
+    for record in records:
+        #Check ID 
+        test_id = str(record.id)
+        test_id2 = test_id
+        if ("/1" in test_id) or ("/2" in test_id):
+            test_id2 = test_id[:-2]
+        #Sequence found
+        if test_id in save_readids or test_id2 in save_readids:
+            count_output += 1
+            yield record
+            #If no more reads to find 
+            if len(save_readids) == count_output:
+                break
+################################################################################
+#Progress Class
+#usage: passes through the lines/reads of a file, updating the user
+#   every [step] items with the message (formatted with the number of 
+#   items found and millions of items read)
+class Progress(object):
+    'Progress of reading a file.'
+    def __init__(self, items, step, message):
+        self.items = items
+        self.step = step
+        self.message = message
+        self.count = 0
+        self.found = 0
+    def update(self):
+        sys.stdout.write('\r\t' + self.message % {'found':self.found, 'mill':float(self.count/1000000.)})
+        sys.stdout.flush()
+    def __iter__(self):
+        for item in self.items:
+            self.count += 1
+            if self.count % self.step == 0:
+                self.update()
+            yield item
+################################################################################
 #Main method 
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-k', dest='kraken_file', required=True,
@@ -187,7 +342,9 @@ def main():
         help='Print output FASTQ reads [requires input FASTQ, default: output is FASTA]')
     parser.set_defaults(append=False)
 
-    args=parser.parse_args()
+    args=parser.parse_args(argv)
+    #Biopython is only needed (and imported) once arguments are parsed
+    from Bio import SeqIO
     
     #Start Program
     time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
@@ -202,7 +359,6 @@ def main():
     save_taxids = {}
     for tid in args.taxid:
         save_taxids[int(tid)] = 0
-    main_lvls = ['R','K','D','P','C','O','F','G','S']
 
     #STEP 0: READ IN REPORT FILE AND GET ALL TAXIDS 
     if args.parents or args.children:
@@ -211,111 +367,21 @@ def main():
             sys.stderr.write(">> ERROR: --report not specified.")
             sys.exit(1)
         sys.stdout.write(">> STEP 0: PARSING REPORT FILE %s\n" % args.report_file)
-        #create tree and save nodes with taxids in the list 
-        base_nodes = {} 
-        r_file = open(args.report_file,'r')
-        prev_node = -1
-        for line in r_file:
-            #extract values
-            report_vals = process_kraken_report(line)
-            if len(report_vals) == 0:
-                continue
-            [taxid, level_num, level_id] = report_vals
-            if taxid == 0:
-                continue 
-            #tree root
-            if taxid == 1:
-                level_id = 'R'
-                root_node = Tree(taxid, level_num, level_id)
-                prev_node = root_node
-                #save if needed
-                if taxid in save_taxids:
-                    base_nodes[taxid] = root_node
-                continue
-            #move to correct parent
-            while level_num != (prev_node.level_num + 1):
-                prev_node = prev_node.parent 
-            #determine correct level ID 
-            if level_id == '-' or len(level_id) > 1:
-                if prev_node.level_id in main_lvls:
-                    level_id = prev_node.level_id + '1'
-                else:
-                    num = int(prev_node.level_id[-1]) + 1
-                    level_id = prev_node.level_id[:-1] + str(num)
-            #make node
-            curr_node = Tree(taxid, level_num, level_id, None, prev_node)
-            prev_node.add_child(curr_node)
-            prev_node = curr_node
-            #save if taxid matches
-            if taxid in save_taxids:
-                base_nodes[taxid] = curr_node 
-        r_file.close()
-        #FOR SAVING PARENTS
-        if args.parents:
-            #For each node saved, traverse up the tree and save each taxid 
-            for tid in base_nodes:
-                curr_node = base_nodes[tid]
-                while curr_node.parent != None:
-                    curr_node = curr_node.parent
-                    save_taxids[curr_node.taxid] = 0
-        #FOR SAVING CHILDREN 
-        if args.children:
-            for tid in base_nodes:
-                curr_nodes = base_nodes[tid].children
-                while len(curr_nodes) > 0:
-                    #For this node
-                    curr_n = curr_nodes.pop()
-                    if curr_n.taxid not in save_taxids:
-                        save_taxids[curr_n.taxid] = 0
-                    #Add all children
-                    if curr_n.children != None:
-                        for child in curr_n.children:
-                            curr_nodes.append(child)
-                    
+        save_taxids = report_taxids(args.report_file, save_taxids, args.parents, args.children)
+
     ##############################################################################
     sys.stdout.write("\t%i taxonomy IDs to parse\n" % len(save_taxids))
     sys.stdout.write(">> STEP 1: PARSING KRAKEN FILE FOR READIDS %s\n" % args.kraken_file)
-    #Initialize values
-    count_kraken = 0
-    read_line = -1
-    exclude_taxids = {} 
-    if args.exclude:
-        exclude_taxids = save_taxids 
-        save_taxids = {} 
     #PROCESS KRAKEN FILE FOR CLASSIFIED READ IDS
     k_file = open(args.kraken_file, 'r')
     sys.stdout.write('\t0 reads processed')
     sys.stdout.flush()
-    #Evaluate each sample in the kraken file
-    save_readids = {}
-    save_readids2 = {} 
-    for line in k_file:
-        count_kraken += 1
-        if (count_kraken % 10000 == 0):
-            sys.stdout.write('\r\t%0.2f million reads processed' % float(count_kraken/1000000.))
-            sys.stdout.flush()
-        #Parse line for results
-        [tax_id, read_id] = process_kraken_output(line)
-        if tax_id == -1:
-            continue
-        #Skip if reads are human/artificial/synthetic
-        if (tax_id in save_taxids) and not args.exclude:
-            save_taxids[tax_id] += 1
-            save_readids2[read_id] = 0
-            save_readids[read_id] = 0 
-        elif (tax_id not in exclude_taxids) and args.exclude:
-            if tax_id not in save_taxids:
-                save_taxids[tax_id] = 1
-            else:
-                save_taxids[tax_id] += 1
-            save_readids2[read_id] = 0
-            save_readids[read_id] = 0 
-        if len(save_readids) >= args.max_reads:
-            break 
+    k_lines = Progress(k_file, 10000, '%(mill)0.2f million reads processed')
+    save_readids = find_read_ids(k_lines, save_taxids, args.exclude, args.max_reads)
     #Update user
     k_file.close()
-    sys.stdout.write('\r\t%0.2f million reads processed\n' % float(count_kraken/1000000.))
-    sys.stdout.write('\t%i read IDs saved\n' % len(save_readids))
+    k_lines.update()
+    sys.stdout.write('\n\t%i read IDs saved\n' % len(save_readids))
     ##############################################################################
     #Sequence files
     seq_file1 = args.seq_file1
@@ -363,71 +429,39 @@ def main():
         o_file = open(args.output_file, 'w')
         if args.output_file2 != '':
             o_file2 = open(args.output_file2, 'w')
+    if args.fastq_out:
+        out_type = "fastq"
+    else:
+        out_type = "fasta"
     #Process SEQUENCE 1 file 
-    count_seqs = 0
-    count_output = 0
-    for record in SeqIO.parse(s_file1,filetype):
-        count_seqs += 1
-        #Print update
-        if (count_seqs % 1000 == 0):
-            sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)' % (count_output, float(count_seqs/1000000.)))
-            sys.stdout.flush()
-        #Check ID 
-        test_id = str(record.id)
-        test_id2 = test_id
-        if ("/1" in test_id) or ("/2" in test_id):
-            test_id2 = test_id[:-2]
-        #Sequence found
-        if test_id in save_readids or test_id2 in save_readids:
-            count_output += 1
-            #Print update
-            sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)' % (count_output, float(count_seqs/1000000.)))
-            sys.stdout.flush()
-            #Save to file
-            if args.fastq_out:
-                SeqIO.write(record, o_file, "fastq")
-            else:
-                SeqIO.write(record, o_file, "fasta")
-        #If no more reads to find 
-        if len(save_readids) == count_output:
-            break
+    records = Progress(SeqIO.parse(s_file1,filetype), 1000, '%(found)i read IDs found (%(mill)0.2f mill reads processed)')
+    for record in extract_reads(records, save_readids):
+        records.found += 1
+        records.update()
+        #Save to file
+        SeqIO.write(record, o_file, out_type)
+    count_output = records.found
     #Close files
     s_file1.close()
     o_file.close()
-    sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)\n' % (count_output, float(count_seqs/1000000.)))
+    records.update()
+    sys.stdout.write('\n')
     sys.stdout.flush()
     if len(seq_file2) > 0:
-        count_output = 0
-        count_seqs = 0
-        sys.stdout.write('\t%i read IDs found (%0.2f mill reads processed)' % (count_output, float(count_seqs/1000000.)))
+        records = Progress(SeqIO.parse(s_file2,filetype), 1000, '%(found)i read IDs found (%(mill)0.2f mill reads processed)')
+        sys.stdout.write('\t%i read IDs found (%0.2f mill reads processed)' % (0, 0.))
         sys.stdout.flush()
-        for record in SeqIO.parse(s_file2, filetype):
-            count_seqs += 1
-            #Print update
-            if (count_seqs % 1000 == 0):
-                sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)' % (count_output, float(count_seqs/1000000.)))
-                sys.stdout.flush()
-            test_id = str(record.id)
-            test_id2 = test_id
-            if ("/1" in test_id) or ("/2" in test_id):
-                test_id2 = test_id[:-2]
-            #Sequence found
-            if test_id in save_readids or test_id2 in save_readids:
-                count_output += 1
-                sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)' % (count_output, float(count_seqs/1000000.)))
-                sys.stdout.flush()
-                #Save to file
-                if args.fastq_out:
-                    SeqIO.write(record, o_file2, "fastq")
-                else:
-                    SeqIO.write(record, o_file2, "fasta")
-            #If no more reads to find 
-            if len(save_readids) == count_output:
-                break
+        for record in extract_reads(records, save_readids):
+            records.found += 1
+            records.update()
+            #Save to file
+            SeqIO.write(record, o_file2, out_type)
+        count_output = records.found
         s_file2.close()
         o_file2.close()
         #End Program
-        sys.stdout.write('\r\t%i read IDs found (%0.2f mill reads processed)\n' % (count_output, float(count_seqs/1000000.)))
+        records.update()
+        sys.stdout.write('\n')
     
     #End Program
     sys.stdout.write('\t' + str(count_output) + ' reads printed to file\n')
@@ -438,7 +472,6 @@ def main():
     #End of program
     time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
     sys.stdout.write("PROGRAM END TIME: " + time + '\n')
-    sys.exit(0)
 
 #################################################################################
 
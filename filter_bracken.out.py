@@ -27,10 +27,14 @@
 #
 #Parameters:
 #   -h, --help...............show help message
-#   -i X, --input-file X.....input bracken output filename
-#   -o X, --output X.........output bracken-style output filename 
+#   -i X, --input-file X.....input bracken output filename[s]
+#   -o X, --output X.........output bracken-style output filename (or directory)
 #   --include X..............include the specified taxids
 #   --exclude X..............exclude the specified taxids 
+#   --include-file X.........include the taxids listed in a file
+#   --exclude-file X.........exclude the taxids listed in a file
+#   -t X, --taxonomy X.......make_ktaxonomy.py taxonomy file (filter clades)
+#   --threads X..............number of files filtered in parallel
 #Input/Output file format (tab-delimited)
 #   - name
 #   - taxonomy ID
@@ -39,85 +43,301 @@
 #   - added reads with abundance reestimation
 #   - total reads after abundance reestimation
 #   - fraction of total reads
+#
+#Bracken/Kraken report files can be filtered as well: removing a taxid
+#removes its whole subtree, and its clade reads are subtracted from each
+#of its ancestors. Taxa left with no reads are removed and all percentages
+#are recalculated.
+#
+#Multiple Bracken output files can be filtered at once (in parallel with 
+#--threads) using the same taxids, writing one filtered file per input file 
+#within an output directory. Given a taxonomy file from make_ktaxonomy.py, 
+#included/excluded taxids also include/exclude all taxids in their clades. 
+#
+#Methods
+#   - main
+#   - read_taxids
+#   - expand_clades
+#   - taxonomy_children
+#   - init_filter
+#   - filter_file
+#   - filter_report
 #######################################################################
 import os, sys, argparse
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input-file', dest='in_file', required=True,
-        help='Input bracken OUTPUT file. [NOT the report file]')
-    parser.add_argument('-o','--output','--output-file', dest='out_file', required=True,
-        help='Output bracken OUTPUT file.')
-    parser.add_argument('--include', dest='t_include',nargs='*', type=str, required=False, 
-        help='List of taxonomy IDs to include in output [space-delimited] - default=All', default=[])
-    parser.add_argument('--exclude', dest='t_exclude',nargs='*', type=str, required=False,
-        help='List of taxonomy IDs to exclude in output [space-delimited] - default=None',default=[])
-    args = parser.parse_args() 
-    
-    #CHECK#1: either taxonomy IDs are included or excluded
-    if len(args.t_include) == 0 and len(args.t_exclude) == 0:
-        sys.stderr.write("User must include at least one taxonomy ID to include or exclude\n")
-        sys.stderr.write("Please specify either --include or --exclude\n")
-        sys.exit(1)
-    #CHECK#2: if both are specified, make sure none exists in both lists
-    if len(args.t_include) > 0 and len(args.t_exclude) > 0:
-        for val in args.t_include:
-            if val in args.t_exclude:
-                sys.stderr.write("%s cannot be in include AND exclude lists\n" % val)
-                sys.exit(1)
-    include = False
-    exclude = False
-    if len(args.t_include) > 0:
-        include = True
-    if len(args.t_exclude) > 0:
-        exclude = True       
-    #Process input file 
-    sys.stdout.write(">> Reading Bracken output file: %s\n" % args.in_file)
-    i_file = open(args.in_file,'r') 
+import multiprocessing
+import kraken_cache
+
+#Taxids to include/exclude (shared by all files filtered in this process)
+t_include = set()
+t_exclude = set()
+#######################################################################
+#read_taxids
+#usage: reads taxids from a file (first column, one taxid per line)
+#input: taxid filename
+#returns: list of taxids
+def read_taxids(in_file):
+    taxids = []
+    t_file = open(in_file, 'r')
+    for line in t_file:
+        line = line.strip()
+        if len(line) == 0 or line[0] == "#":
+            continue
+        taxids.append(line.split("\t")[0])
+    t_file.close()
+    return taxids
+#expand_clades
+#usage: adds all taxids within the clades of the given taxids 
+#input: 
+#   - taxonomy file from make_ktaxonomy.py
+#   - list of sets of taxids to expand
+#returns: list of sets of expanded taxids
+def expand_clades(tax_file, taxid_sets):
+    #Children of each taxid (once per taxonomy file, see kraken_cache.py)
+    parent2child = kraken_cache.load(tax_file, 'taxonomy children', taxonomy_children)
+    #Add all descendants of each taxid
+    clade_sets = []
+    for taxids in taxid_sets:
+        clades = set(taxids)
+        toparse = list(taxids)
+        while len(toparse) > 0:
+            taxid = toparse.pop()
+            for child in parent2child.get(taxid, []):
+                if child not in clades:
+                    clades.add(child)
+                    toparse.append(child)
+        clade_sets.append(clades)
+    return clade_sets
+#taxonomy_children
+#usage: returns the dictionary of taxid to children taxids of a 
+#   make_ktaxonomy.py taxonomy file
+def taxonomy_children(tax_file):
+    parent2child = {}
+    for [taxid, p_tid] in kraken_cache.read_taxonomy(tax_file)[0].items():
+        if taxid == p_tid:
+            continue
+        if p_tid not in parent2child:
+            parent2child[p_tid] = []
+        parent2child[p_tid].append(taxid)
+    return parent2child
+#init_filter
+#usage: saves the taxids to include/exclude for all files filtered in this 
+#   process (run once per process) 
+def init_filter(include, exclude):
+    global t_include, t_exclude
+    t_include = include
+    t_exclude = exclude
+#filter_file
+#usage: filters a single Bracken output file (or report file, see filter_report)
+#   (run independently for each file, possibly in a separate process)
+#input: list of the input and output filenames
+#returns: list of the input filename, reads remaining and reads excluded 
+#   (-1 reads remaining if the input file is not in Bracken output or report format)
+def filter_file(params):
+    [in_file, out_file] = params
+    include = len(t_include) > 0
     tot_reads = 0
     excl_reads = 0
     first = True
-    first_line = ""
-    save_taxid2all = {}
-    save_taxid2reads = {} 
+    firstline = ""
+    save_lines = []
+    i_file = open(in_file,'r') 
     for line in i_file:
         line = line.strip()
         #Check format
         if first:
             if line.split("\t") != ["name","taxonomy_id","taxonomy_lvl","kraken_assigned_reads","added_reads","new_est_reads","fraction_total_reads"]:
-                sys.stderr.write("\t%s not in Bracken output format\n" % args.in_file)
-                sys.exit(1)
+                i_file.close()
+                return filter_report(in_file, out_file)
             first = False
             firstline = line + "\n"
             continue
         #Get reads 
         l_vals = line.split("\t")
-        if include:
-            if l_vals[1] in args.t_include: 
-                save_taxid2all[l_vals[1]] = l_vals[0:6]
-                save_taxid2reads[l_vals[1]] = int(l_vals[5])
-                tot_reads += int(l_vals[5])
-            else:
-                excl_reads += int(l_vals[5])
-        elif exclude:
-            if l_vals[1] not in args.t_exclude:
-                save_taxid2all[l_vals[1]] = l_vals[0:6]
-                save_taxid2reads[l_vals[1]] = int(l_vals[5])
-                tot_reads += int(l_vals[5])
-            else:
-                excl_reads += int(l_vals[5])
-    sys.stdout.write("\t%i reads remaining (%i reads excluded)\n" % (tot_reads, excl_reads))         
+        reads = int(l_vals[5])
+        if (include and l_vals[1] not in t_include) or l_vals[1] in t_exclude:
+            excl_reads += reads
+            continue
+        save_lines.append([reads, "\t".join(l_vals[0:6])])
+        tot_reads += reads
     i_file.close()
 
     #Write output file with updated fractions
-    sys.stdout.write(">> Writing filtered Bracken output to %s\n" % args.out_file)
-    o_file = open(args.out_file,'w')
+    o_file = open(out_file,'w')
     o_file.write(firstline)
-    for [taxid, reads] in sorted(save_taxid2reads.items(), key=lambda kv: kv[1], reverse=True):
+    for [reads, line] in sorted(save_lines, key=lambda kv: kv[0], reverse=True):
         new_fraction = float(reads) / float(tot_reads)
-        for val in save_taxid2all[taxid]:
-            o_file.write(val + "\t")
-        o_file.write("%0.10f\n" % new_fraction)
+        o_file.write(line + "\t%0.10f\n" % new_fraction)
+    o_file.close()
+    return [in_file, tot_reads, excl_reads]
+#filter_report
+#usage: filters a single Bracken/Kraken report file in one pass, keeping the 
+#   lines of the current taxon's ancestors in a stack (indexed by depth) 
+#input: input and output filenames
+#returns: list of the input filename, reads remaining and reads excluded 
+#   (-1 reads remaining if the input file is not in report format)
+def filter_report(in_file, out_file):
+    include = len(t_include) > 0
+    #Lines saved as [report columns, clade reads, taxon reads, depth]
+    save_lines = []
+    ancestors = []
+    skip_depth = -1
+    clade_depth = -1
+    excl_reads = 0
+    i_file = open(in_file,'r')
+    for line in i_file:
+        line = line.rstrip("\r\n")
+        #Skip empty/header lines
+        if len(line) == 0 or (len(save_lines) == 0 and line[0] in "#%"):
+            continue
+        #Check format
+        l_vals = line.split("\t")
+        if len(l_vals) < 6 or not l_vals[1].isdigit() or not l_vals[2].isdigit():
+            i_file.close()
+            return [in_file, -1, 0]
+        all_reads = int(l_vals[1])
+        lvl_reads = int(l_vals[2])
+        taxid = l_vals[-2]
+        if not taxid.isdigit():
+            taxid = l_vals[-3]
+        name = l_vals[-1]
+        depth = int((len(name) - len(name.lstrip(' ')))/2)
+        #Skip lines within a removed subtree
+        if skip_depth >= 0 and depth > skip_depth:
+            continue
+        skip_depth = -1
+        del ancestors[depth:]
+        #Lines within an included clade keep all their reads
+        if clade_depth >= 0 and depth > clade_depth:
+            in_clade = True
+        else:
+            clade_depth = -1
+            in_clade = not include
+        #Remove subtree
+        if taxid in t_exclude:
+            skip_depth = depth
+            excl_reads += all_reads
+            if in_clade:
+                for i in ancestors:
+                    save_lines[i][1] -= all_reads
+            continue
+        #Start of an included clade: add reads to ancestors
+        if include and not in_clade and taxid in t_include:
+            in_clade = True
+            clade_depth = depth
+            for i in ancestors:
+                save_lines[i][1] += all_reads
+        #Lines outside of included clades keep only reads from included clades
+        if in_clade:
+            save_lines.append([l_vals, all_reads, lvl_reads, depth])
+        else:
+            save_lines.append([l_vals, 0, 0, depth])
+        ancestors.append(len(save_lines) - 1)
+    i_file.close()
+    tot_reads = sum([vals[1] for vals in save_lines if vals[3] == 0])
+    if include:
+        excl_reads = sum([int(vals[0][1]) for vals in save_lines if vals[3] == 0]) - tot_reads
+
+    #Write output file with updated counts and percentages 
+    o_file = open(out_file,'w')
+    for [l_vals, all_reads, lvl_reads, depth] in save_lines:
+        if all_reads == 0 and int(l_vals[1]) > 0:
+            continue
+        if tot_reads > 0:
+            percent = 100*float(all_reads)/float(tot_reads)
+        else:
+            percent = 0.0
+        if l_vals[0][0:1] == " ":
+            percent = "%6.2f" % percent
+        else:
+            percent = "%0.2f" % percent
+        o_file.write("\t".join([percent, str(all_reads), str(lvl_reads)] + l_vals[3:]) + "\n")
     o_file.close()
+    return [in_file, tot_reads, excl_reads]
+#######################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input-file', dest='in_files', required=True, nargs='+',
+        help='Input bracken OUTPUT or REPORT file[s].')
+    parser.add_argument('-o','--output','--output-file', dest='out_file', required=True,
+        help='Output bracken OUTPUT/REPORT file. [output directory if multiple input files are given]')
+    parser.add_argument('--include', dest='t_include',nargs='*', type=str, required=False, 
+        help='List of taxonomy IDs to include in output [space-delimited] - default=All', default=[])
+    parser.add_argument('--exclude', dest='t_exclude',nargs='*', type=str, required=False,
+        help='List of taxonomy IDs to exclude in output [space-delimited] - default=None',default=[])
+    parser.add_argument('--include-file', dest='include_file', required=False, default='',
+        help='File of taxonomy IDs to include in output [one per line]')
+    parser.add_argument('--exclude-file', dest='exclude_file', required=False, default='',
+        help='File of taxonomy IDs to exclude in output [one per line]')
+    parser.add_argument('-t', '--taxonomy', dest='tax_file', required=False, default='',
+        help='Taxonomy file from make_ktaxonomy.py: include/exclude all taxonomy IDs within the given clades')
+    parser.add_argument('--threads', required=False, dest='threads',
+        default=1, type=int, help='Number of processes used to filter files [default: 1]')
+    args = parser.parse_args(argv) 
+    
+    #Read taxids 
+    include = set(args.t_include)
+    exclude = set(args.t_exclude)
+    if args.include_file != '':
+        include.update(read_taxids(args.include_file))
+    if args.exclude_file != '':
+        exclude.update(read_taxids(args.exclude_file))
+    #CHECK#1: either taxonomy IDs are included or excluded
+    if len(include) == 0 and len(exclude) == 0:
+        sys.stderr.write("User must include at least one taxonomy ID to include or exclude\n")
+        sys.stderr.write("Please specify either --include or --exclude\n")
+        sys.exit(1)
+    #CHECK#2: if both are specified, make sure none exists in both lists
+    for val in include & exclude:
+        sys.stderr.write("%s cannot be in include AND exclude lists\n" % val)
+        sys.exit(1)
+    #Add clades
+    if args.tax_file != '':
+        sys.stdout.write(">> Reading taxonomy %s\n" % args.tax_file)
+        [include, exclude] = expand_clades(args.tax_file, [include, exclude])
+        sys.stdout.write("\t%i taxids included, %i taxids excluded\n" % (len(include), len(exclude)))
+    
+    #Determine output file for each input file
+    if len(args.in_files) == 1:
+        out_files = [args.out_file]
+    else:
+        out_files = [os.path.join(args.out_file, os.path.basename(in_file)) for in_file in args.in_files]
+        for i in range(len(args.in_files)):
+            if os.path.abspath(out_files[i]) == os.path.abspath(args.in_files[i]):
+                sys.stderr.write("Output directory cannot contain the input file %s\n" % args.in_files[i])
+                sys.exit(1)
+        #Input files with the same filename would be written to the same output
+        out2input = {}
+        for [in_file, out_file] in zip(args.in_files, out_files):
+            if out_file in out2input:
+                sys.stderr.write("Input files %s and %s would both be written to %s\n" % (out2input[out_file], in_file, out_file))
+                sys.stderr.write("Please rename the input files\n")
+                sys.exit(1)
+            out2input[out_file] = in_file
+        if not os.path.isdir(args.out_file):
+            os.makedirs(args.out_file)
+    params = [[args.in_files[i], out_files[i]] for i in range(len(args.in_files))]
+
+    #Process input files
+    sys.stdout.write(">> Filtering %i Bracken file(s)\n" % len(params))
+    if args.threads > 1:
+        pool = multiprocessing.Pool(args.threads, init_filter, (include, exclude))
+        results = pool.imap(filter_file, params)
+    else:
+        pool = None
+        init_filter(include, exclude)
+        results = map(filter_file, params)
+    errors = 0
+    for [in_file, tot_reads, excl_reads] in results:
+        if tot_reads < 0:
+            sys.stderr.write("\t%s not in Bracken output or report format\n" % in_file)
+            errors += 1
+            continue
+        sys.stdout.write("\t%s: %i reads remaining (%i reads excluded)\n" % (in_file, tot_reads, excl_reads))         
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if errors > 0:
+        sys.exit(1)
 
 #######################################################################
 if __name__ == "__main__":
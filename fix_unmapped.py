@@ -37,7 +37,7 @@
 import os, sys, argparse
 import gzip 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--input','--input_file', 
         type=str, dest='in_file', required=True,
@@ -54,7 +54,7 @@ def main():
     parser.add_argument('-r','--remaining',required=False, 
         default='still_unmapped.txt',dest='rem_file', 
         help='Name of text file containing non-found accessions from input file')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     #STEP 1: READ IN ACCESSIONS 
     count_a = 0
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+####################################################################
+#kraken_cache.py keeps the files parsed by KrakenTools programs
+#(make_ktaxonomy.py taxonomy files, kraken reports, krona files), so
+#programs run in the same process share them
+#Copyright (C) 2020 Jennifer Lu, jennifer.lu717@gmail.com
+
+#This file is part of KrakenTools.
+#KrakenTools is free software; you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation; either version 3 of the license, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+####################################################################
+#Jennifer Lu, jlu26@jhmi.edu
+#
+#Each file is saved by path, modification time and size, and parsed
+#again only if it is changed on disk. Taxonomy files are parsed once
+#(read_taxonomy) for all programs: make_kreport.py, filter_bracken.out.py
+#and the DiversityTools each save what they build from the taxonomy under
+#their own kind of file.
+#
+#Taxonomies are always kept. Reports are only kept when keep_reports is
+#set (by krakentools.py pipelines, where later subcommands often read
+#the same reports), so single programs never hold every report in memory.
+#
+#Used by make_kreport.py, filter_bracken.out.py and
+#DiversityTools/kreport_levels.py
+#
+#Methods
+#   - load
+#   - read_taxonomy
+#   - clear
+####################################################################
+import os
+
+#Saved files: [kind of file, path] -> [modification time/size, parsed file]
+files = {}
+#Whether to keep parsed reports (kinds 'kreport' and 'krona')
+keep_reports = False
+
+#load
+#usage: returns a parsed file, parsing it only if it is not saved yet
+#   (or changed on disk since it was saved)
+#input:
+#   - filename
+#   - kind of file (files are saved separately for each kind)
+#   - parse: method returning the parsed file from the filename
+#returns: parsed file
+def load(filename, kind, parse):
+    stat = os.stat(filename)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (kind, os.path.abspath(filename))
+    if key in files and files[key][0] == stamp:
+        return files[key][1]
+    parsed = parse(filename)
+    if keep_reports or kind not in ['kreport', 'krona']:
+        files[key] = [stamp, parsed]
+    return parsed
+
+#read_taxonomy
+#usage: parses a make_ktaxonomy.py taxonomy file (once per file)
+#returns: dictionaries of the parent, rank, depth and name of each taxid
+#   (in file order, parents before children)
+def read_taxonomy(tax_file):
+    return load(tax_file, 'taxonomy', parse_taxonomy)
+def parse_taxonomy(tax_file):
+    taxid2parent = {}
+    taxid2rank = {}
+    taxid2depth = {}
+    taxid2name = {}
+    t_file = open(tax_file, 'r')
+    for line in t_file:
+        l_vals = line.strip().split('\t|\t')
+        [taxid, p_taxid, rank, lvl_num] = l_vals[0:4]
+        name = l_vals[4] if len(l_vals) > 4 else ''
+        taxid2parent[taxid] = p_taxid
+        taxid2rank[taxid] = rank
+        taxid2depth[taxid] = int(lvl_num)
+        taxid2name[taxid] = name
+    t_file.close()
+    return [taxid2parent, taxid2rank, taxid2depth, taxid2name]
+
+#clear
+#usage: removes all saved files
+def clear():
+    files.clear()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+######################################################################
+#krakentools.py runs any of the KrakenTools programs as a subcommand
+#Copyright (C) 2020 Jennifer Lu, jennifer.lu717@gmail.com
+#
+#This file is part of KrakenTools.
+#KrakenTools is free software; you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation; either version 3 of the license, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+######################################################################
+#Jennifer Lu, jlu26@jhmi.edu
+#Updated: 07/12/2020
+#
+#This program runs the KrakenTools programs as subcommands:
+#   python krakentools.py SUBCOMMAND [options]
+#
+#Each subcommand runs the main method of its program with the given options.
+#Programs (and the packages they require, e.g. numpy or Biopython) are only
+#loaded when one of their subcommands is run.
+#
+#Multiple subcommands separated by "+" are run one after the other within
+#the same process, e.g.
+#   python krakentools.py alpha -f A.KREPORT B.KREPORT -t kreport + \
+#       beta -i A.KREPORT B.KREPORT --type kreport --level S
+#Taxonomy files and reports parsed by one subcommand are then reused by the
+#following subcommands (make-kreport, filter-bracken and beta share
+#taxonomy files; alpha and beta share kraken reports),
+#unless changed on disk (see kraken_cache.py)
+#
+#krakentools can also be imported to run the core operations of the programs
+#on kraken output/report lines, sequence records and counts in memory, 
+#without intermediate files, e.g.
+#   import krakentools
+#   taxonomy = krakentools.read_taxonomy('mydb_taxonomy.txt')
+#   samples = []
+#   for kraken_file in ['A.kraken', 'B.kraken']:
+#       report = list(krakentools.make_kreport(open(kraken_file), taxonomy))
+#       mpa = krakentools.kreport2mpa(report)
+#       samples += krakentools.sample_counts(mpa, 'S', 'mpa')
+#   bc = krakentools.beta_diversity(samples)
+#
+#Methods
+#   - load_program
+#   - print_usage
+#   - main
+#Library methods
+#   - read_taxonomy
+#   - make_kreport
+#   - combine_kreports
+#   - kreport2mpa
+#   - kreport2krona
+#   - extract_reads
+#   - sample_counts
+#   - alpha_diversity
+#   - beta_diversity
+#
+######################################################################
+import os, sys
+import importlib.util
+
+#Subcommands: [name, program file, description]
+SUBCOMMANDS = [
+    ['extract', 'extract_kraken_reads.py', 'extract reads classified at the given taxids'],
+    ['make-kreport', 'make_kreport.py', 'make a kraken report from a kraken output file'],
+    ['make-ktaxonomy', 'make_ktaxonomy.py', 'make a taxonomy file for make-kreport'],
+    ['combine-kreports', 'combine_kreports.py', 'combine multiple kraken reports'],
+    ['kreport2mpa', 'kreport2mpa.py', 'convert kraken reports to mpa-style files'],
+    ['kreport2krona', 'kreport2krona.py', 'convert kraken reports to krona files'],
+    ['combine-mpa', 'combine_mpa.py', 'combine multiple mpa-style files'],
+    ['filter-bracken', 'filter_bracken.out.py', 'filter bracken outputs/reports by taxids'],
+    ['fix-unmapped', 'fix_unmapped.py', 'find taxids for unmapped accessions'],
+    ['alpha', os.path.join('DiversityTools', 'alpha_diversity.py'), 'calculate alpha diversities'],
+    ['beta', os.path.join('DiversityTools', 'beta_diversity.py'), 'calculate beta diversities']]
+
+#load_program
+#usage: imports a KrakenTools program (only once per process)
+#input: program file, relative to this file's directory
+#returns: program module
+def load_program(filename):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    name = os.path.basename(filename)[:-3].replace('.', '_')
+    if name in sys.modules:
+        return sys.modules[name]
+    #Programs import other modules from their own directory
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+#print_usage
+def print_usage(o_file):
+    o_file.write("usage: krakentools.py SUBCOMMAND [options] [+ SUBCOMMAND [options] ...]\n\n")
+    o_file.write("subcommands:\n")
+    for [name, filename, description] in SUBCOMMANDS:
+        o_file.write("  %-18s%s\n" % (name, description))
+    o_file.write("\nRun 'krakentools.py SUBCOMMAND -h' for the options of each subcommand\n")
+
+######################################################################
+#read_taxonomy
+#usage: reads a make_ktaxonomy.py taxonomy file (for make_kreport)
+#returns: taxonomy tree [root node, dictionary of taxid to node]
+def read_taxonomy(tax_file):
+    return load_program('make_kreport.py').read_taxonomy(tax_file)
+
+#make_kreport
+#usage: makes a kraken report from kraken output lines
+#input: kraken output lines, taxonomy (from read_taxonomy), whether to 
+#   count the sum of read lengths instead of reads
+#returns: kraken report lines (generator)
+def make_kreport(kraken_lines, taxonomy, use_read_len=False):
+    return load_program('make_kreport.py').make_kreport(kraken_lines, taxonomy, use_read_len)
+
+#combine_kreports
+#usage: combines kraken reports (filenames or lists of report lines)
+#input: reports, sample names [default: S1, S2, etc], and the 
+#   combine_kreports.py options (--no-headers, --only-combined, 
+#   --min-count, --top-k)
+#returns: combined report lines (generator)
+def combine_kreports(reports, sample_names=[], headers=True, c_only=False, min_count=0, top_k=0):
+    combined = load_program('combine_kreports.py').combine_reports(reports, sample_names)
+    return combined.lines(headers, c_only, min_count, top_k)
+
+#kreport2mpa
+#usage: converts a kraken report (filename or lines) to mpa-style lines
+#input: report and the kreport2mpa.py options (--intermediate-ranks, 
+#   --percentages, --keep-spaces, header name for --display-header)
+#returns: list of mpa-style lines
+def kreport2mpa(report, x_include=False, use_reads=True, remove_spaces=True, header=''):
+    return load_program('kreport_convert.py').mpa_lines(report, x_include, use_reads, remove_spaces, header)
+
+#kreport2krona
+#usage: converts a kraken report (filename or lines) to Krona text lines
+#returns: list of Krona text lines
+def kreport2krona(report, x_include=False):
+    return load_program('kreport_convert.py').krona_lines(report, x_include)
+
+#extract_reads
+#usage: extracts the reads classified at the given taxids
+#input:
+#   - kraken output lines
+#   - sequence records (e.g. from Bio.SeqIO.parse)
+#   - list of taxids
+#   - kraken report (filename or lines) [required only for parents/children]
+#   - the extract_kraken_reads.py options (--include-parents, 
+#       --include-children, --exclude, --max)
+#returns: records found (generator)
+def extract_reads(kraken_lines, records, taxids, report=None, parents=False, 
+        children=False, exclude=False, max_reads=100000000):
+    program = load_program('extract_kraken_reads.py')
+    save_taxids = dict([[int(taxid), 0] for taxid in taxids])
+    if parents or children:
+        save_taxids = program.report_taxids(report, save_taxids, parents, children)
+    save_readids = program.find_read_ids(kraken_lines, save_taxids, exclude, max_reads)
+    return program.extract_reads(records, save_readids)
+
+#sample_counts
+#usage: reads the counts of each taxon at the given level
+#input: lines of a kraken report ('kreport'), krona file ('krona'), 
+#   bracken output ('bracken'), combined report ('combined') or 
+#   mpa-style file ('mpa'), level (S, G, F, O, C, P, D) 
+#returns: list of dictionaries of counts per taxon, one per sample 
+#   in the lines (for alpha_diversity/beta_diversity)
+def sample_counts(lines, level='S', filetype='kreport'):
+    beta = load_program(os.path.join('DiversityTools', 'beta_diversity.py'))
+    if filetype in ['kreport', 'krona']:
+        levels = load_program(os.path.join('DiversityTools', 'kreport_levels.py'))
+        if filetype == 'krona':
+            tree = levels.read_krona(lines)
+        else:
+            tree = levels.read_kreport(lines)
+        [taxa, n] = tree.level_counts(level)
+        return [beta.sample_counts(taxa, n)]
+    alpha = load_program(os.path.join('DiversityTools', 'alpha_diversity.py'))
+    if filetype == 'bracken':
+        [names, taxa, n] = alpha.read_bracken('', lines)
+    elif filetype == 'combined':
+        [names, taxa, n] = alpha.read_combined('', level, lines)
+    else:
+        [names, taxa, n] = alpha.read_mpa('', level, lines)
+    return [beta.sample_counts(taxa, n[:,i]) for i in range(n.shape[1])]
+
+#alpha_diversity
+#usage: calculates all alpha diversities of each sample
+#input: list of dictionaries of counts per taxon (from sample_counts)
+#returns: dictionary of alpha diversity type (Sh, BP, Si, ISi, F, Chao1, 
+#   ACE, Ev) to numpy array with one value per sample
+def alpha_diversity(samples):
+    beta = load_program(os.path.join('DiversityTools', 'beta_diversity.py'))
+    [counts, taxa] = beta.fill_counts(samples, len(samples))
+    return load_program(os.path.join('DiversityTools', 'alpha_diversity.py')).alpha_diversity(counts)
+
+#beta_diversity
+#usage: calculates the matrix of dissimilarities between samples
+#input: list of dictionaries of counts per taxon (from sample_counts),
+#   and the beta_diversity.py options (--metric, --taxonomy, --threads)
+#returns: samples x samples numpy matrix of dissimilarities
+def beta_diversity(samples, metric='braycurtis', tax_file='', threads=1):
+    beta = load_program(os.path.join('DiversityTools', 'beta_diversity.py'))
+    return beta.beta_diversity(samples, metric, tax_file, threads=threads)
+
+######################################################################
+#Main method
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) == 0 or argv[0] in ['-h', '--help']:
+        print_usage(sys.stdout)
+        sys.exit(0)
+    #Split into subcommands
+    commands = [[]]
+    for arg in argv:
+        if arg == '+':
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    name2file = dict([[name, filename] for [name, filename, description] in SUBCOMMANDS])
+    for command in commands:
+        if len(command) == 0 or command[0] not in name2file:
+            sys.stderr.write("Unknown subcommand: %s\n" % " ".join(command[0:1]))
+            print_usage(sys.stderr)
+            sys.exit(1)
+    #Run each subcommand (keeping parsed reports for the following subcommands)
+    kraken_cache = load_program('kraken_cache.py')
+    kraken_cache.keep_reports = len(commands) > 1
+    prog = sys.argv[0]
+    for command in commands:
+        program = load_program(name2file[command[0]])
+        #Usage/error messages show the subcommand
+        sys.argv[0] = "krakentools.py " + command[0]
+        try:
+            program.main(command[1:])
+        except SystemExit as e:
+            #A program exiting successfully continues with the next subcommand
+            if e.code not in [0, None]:
+                raise
+    sys.argv[0] = prog
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,9 @@
 #   -o X, --output X.........output Krona text filename 
 #   --intermediate-ranks.....include non-traditional taxonomic ranks 
 #   --no-intermediate-ranks..do not include non-traditional ranks [default] 
+#   --html...................output a Krona HTML chart [one dataset per report]
+#                            instead of Krona text (no ktImportText needed)
+#   --sample-names...........dataset names for the HTML chart [default: report filenames]
 #Input file format (tab-delimited)
 #   - percentage of total reads
 #   - number of reads (including reads within subtree)
@@ -43,69 +46,14 @@
 #
 #Methods
 #   - main
-#   - process_kraken_report
+#   - kreport2krona_all
+#   - kreport2krona_main
+#   - kreport2krona_html
+#   (report parsing and conversion: see kreport_convert.py)
 ####################################################################
 import os, sys, argparse
-
-####################################################################
-#process_kraken_report
-#usage: parses a single line in the kraken report and extracts relevant information
-#input: kraken report file with the following tab delimited lines
-#   - percent of total reads
-#   - number of reads (including at lower levels)
-#   - number of reads (only at this level)
-#   - taxonomy classification of level
-#       (U, D, P, C, O, F, G, S, -)
-#   - taxonomy ID (0 = unclassified, 1 = root, 2 = Bacteria,...etc)
-#   - spaces + name
-#returns:
-#   - classification/genome name
-#   - level name (U, -, D, P, C, O, F, G, S)
-#   - reads classified at this level and below in the tree
-def process_kraken_report(curr_str):
-    split_str = curr_str.strip().split('\t')
-    if len(split_str) < 2:
-        return []
-    try:
-        int(split_str[1])
-    except ValueError:
-        return []
-    all_reads = int(split_str[1])
-    lvl_reads = int(split_str[2])
-    
-    try:
-        taxid = int(split_str[-3])
-        level_type = split_str[-2]
-        map_kuniq = {'species':'S', 'genus':'G', 'family':'F',
-            'order':'O','class':'C','phylum':'P','superkingdom':'D',
-            'kingdom':'K'}
-        if level_type not in map_kuniq:
-            level_type = '-'
-        else:
-            level_type = map_kuniq[level_type]
-    except ValueError:
-        level_type = split_str[-3]
-    type2main = {'superkingdom':'D','phylum':'P',
-        'class':'C','order':'O','family':'F',
-        'genus':'G','species':'S'} 
-    if len(level_type) > 1:
-        if level_type in type2main:
-            level_type = type2main[level_type]
-        else:
-            level_type = '-'
-    #Get name and spaces 
-    spaces = 0
-    name = split_str[-1]
-    for char in name:
-        if char == ' ':
-            name = name[1:]
-            spaces += 1
-        else:
-            break
-    name = name.replace(' ','_')
-    #Determine level based on number of spaces
-    level_num = spaces/2
-    return [name, level_num, level_type, lvl_reads]
+from kreport_convert import convert_kreport, KronaWriter
+from kreport_convert import KronaChart, KronaChartWriter
 
 ###################################################################
 #kreport2krona_all
@@ -113,52 +61,9 @@ def process_kraken_report(curr_str):
 #input: kraken report file and output krona file names 
 #returns: none 
 def kreport2krona_all(report_file, out_file):
-    #Process report file and output 
-    curr_path = [] 
-    prev_lvl_num = -1
-    r_file = open(report_file, 'r')
     o_file = open(out_file, 'w')
-    #Read through report file 
-    main_lvls = ['D','P','C','O','F','G','S']
-    for line in r_file:
-        report_vals = process_kraken_report(line)
-        #If header line, skip
-        if len(report_vals) < 4: 
-            continue
-        #Get relevant information from the line 
-        [name, level_num, level_type, lvl_reads] = report_vals
-        if level_type == 'U':
-            o_file.write(str(lvl_reads) + "\tUnclassified\n")
-            continue
-        #Create level name 
-        if level_type not in main_lvls:
-            level_type = "x"
-        elif level_type == "D":
-            level_type = "K"
-        level_str = level_type.lower() + "__" + name
-        #Determine full string to add
-        if prev_lvl_num == -1:
-            #First level
-            prev_lvl_num = level_num
-            curr_path.append(level_str)
-            o_file.write(str(lvl_reads) + "\t" + level_str + "\n")
-        else:
-            o_file.write(str(lvl_reads))
-            #Move back if needed
-            while level_num != (prev_lvl_num + 1):
-                prev_lvl_num -= 1
-                curr_path.pop()
-            #Print all ancestors of current level followed by |
-            for string in curr_path:
-                if string[0] != "r": 
-                    o_file.write("\t" + string)
-            #Print final level and then number of reads
-            o_file.write("\t" + level_str + "\n")
-            #Update
-            curr_path.append(level_str)
-            prev_lvl_num = level_num
+    convert_kreport(report_file, [KronaWriter(o_file, True)])
     o_file.close()
-    r_file.close()
     
 ###################################################################
 #kreport2krona_main
@@ -166,116 +71,69 @@ def kreport2krona_all(report_file, out_file):
 #input: kraken report file and output krona file names 
 #returns: none 
 def kreport2krona_main(report_file, out_file):
-    #Process report file and output 
-    main_lvls = ['D','P','C','O','F','G','S']
-    curr_path = [] 
-    prev_lvl_num = -1
-    num2path = {} 
-    path2reads = {} 
-    line_num = -1
-    #Read through report file 
-    r_file = open(report_file, 'r')
-    for line in r_file:
-        line_num += 1
-        #########################################
-        report_vals = process_kraken_report(line)
-        #If header line, skip
-        if len(report_vals) < 4: 
-            continue
-        #Get relevant information from the line 
-        [name, level_num, level_type, lvl_reads] = report_vals
-        if level_type == 'U':
-            num2path[line_num] = ["Unclassified"]
-            path2reads["Unclassified"] = lvl_reads 
-            continue
-        #########################################
-        #Create level name 
-        if level_type not in main_lvls:
-            level_type = "x"
-        elif level_type == "D":
-            level_type = "K"
-        level_str = level_type.lower() + "__" + name
-        #########################################
-        #Determine full string to add
-        if prev_lvl_num == -1:
-            #First level
-            prev_lvl_num = level_num
-            curr_path.append(level_str)
-            #Save
-            if curr_path[-1][0] == "x":
-                num2path[line_num] = ""
-            else:
-                path2reads[curr_path[-1]] = lvl_reads
-                num2path[line_num] = []
-                for i in curr_path:
-                    num2path[line_num].append(i)
-            continue
-        else:
-            #########################################
-            #Move back if needed
-            while level_num != (prev_lvl_num + 1):
-                prev_lvl_num -= 1
-                curr_path.pop()
-            #Update the list 
-            curr_path.append(level_str)
-            prev_lvl_num = level_num
-            #########################################
-            #IF AT NON-TRADITIONAL LEVEL, ADD TO PARENT
-            if level_type == "x":
-                test_num = len(curr_path) - 1
-                while(test_num >= 0):
-                    if curr_path[test_num][0] != "x":
-                        path2reads[curr_path[test_num]] += lvl_reads 
-                        test_num = -1
-                    test_num = test_num - 1 
-                num2path[line_num] = ""
-            #IF AT TRADITIONAL LEVEL, SAVE 
-            if level_type != "x":
-                path2reads[curr_path[-1]] = lvl_reads
-                num2path[line_num] = []
-                for i in curr_path:
-                    num2path[line_num].append(i)
-    r_file.close() 
-    
-    #WRITE OUTPUT FILE
     o_file = open(out_file, 'w')
-    for i in range(0,line_num+1):
-        #Get values
-        if i not in num2path:
-            continue
-        curr_path = num2path[i] 
-        if len(curr_path) > 0:
-            curr_reads = path2reads[curr_path[-1]] 
-            if curr_path[-1][0] != "x":
-                o_file.write("%i" % curr_reads)
-            for name in curr_path:
-                if name[0] != "r" and name[0] != "x":
-                    o_file.write("\t%s" % name)
-            o_file.write("\n")
+    convert_kreport(report_file, [KronaWriter(o_file, False)])
+    o_file.close()
+
+###################################################################
+#kreport2krona_html
+#usage: prints a Krona HTML chart with one dataset per kraken report
+#input: kraken report file names, dataset names, output HTML file name,
+#   whether to include intermediate ranks, URL of Krona resources
+#returns: none 
+def kreport2krona_html(report_files, names, out_file, x_include, url):
+    chart = KronaChart(names, url)
+    for [i, report_file] in enumerate(report_files):
+        convert_kreport(report_file, [KronaChartWriter(chart, i, x_include)])
+    o_file = open(out_file, 'w')
+    chart.write(o_file)
     o_file.close()
 
 ######################################################################
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-r', '--report-file', '--report', required=True,
-        dest='r_file', help='Input kraken report file for converting')
+        nargs='+', dest='r_files', help='Input kraken report file[s] for converting \
+        [multiple reports only with --html]')
     parser.add_argument('-o', '--output', required=True,
         dest='o_file', help='Output krona-report file name')
+    parser.add_argument('--html', action='store_true',
+        dest='html', default=False, required=False,
+        help='Output a Krona HTML chart instead of Krona text (one dataset per report)')
+    parser.add_argument('--sample-names', required=False, nargs='+',
+        dest='s_names', default=[], help='Dataset names for each report in the HTML chart \
+        [default: report filenames]')
+    parser.add_argument('--krona-url', required=False, dest='krona_url',
+        default='https://krona.sourceforge.net',
+        help='URL of Krona resources used by the HTML chart [default: https://krona.sourceforge.net]')
     parser.add_argument('--intermediate-ranks', action='store_true',
         dest='x_include', default=False, required=False,
         help='Include non-traditional taxonomic ranks in output')
     parser.add_argument('--no-intermediate-ranks', action='store_false',
         dest='x_include', default=False, required=False,
         help='Do not include non-traditional taxonomic ranks in output [default: no intermediate ranks]')
-    args=parser.parse_args()
+    args=parser.parse_args(argv)
 
+    #Krona HTML chart with all reports
+    if args.html:
+        if len(args.s_names) > 0 and len(args.s_names) != len(args.r_files):
+            sys.stderr.write("Number of sample names provided does not match number of reports\n")
+            sys.exit(1)
+        names = args.s_names
+        if len(names) == 0:
+            names = [os.path.basename(r_file) for r_file in args.r_files]
+        kreport2krona_html(args.r_files, names, args.o_file, args.x_include, args.krona_url)
+        return
+    if len(args.r_files) > 1:
+        sys.stderr.write("Multiple report files can only be converted with --html\n")
+        sys.exit(1)
     #Determine which krona report to make 
     if args.x_include:
-        kreport2krona_all(args.r_file,args.o_file)
+        kreport2krona_all(args.r_files[0],args.o_file)
     else:
-        kreport2krona_main(args.r_file,args.o_file) 
+        kreport2krona_main(args.r_files[0],args.o_file) 
 
 #################################################################
 if __name__ == "__main__":
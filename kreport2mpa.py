@@ -45,73 +45,52 @@
 #   - Taxonomy tree levels |-delimited, with level type [d,k,p,c,o,f,g,s,x]
 #   - Number of reads within subtree of the specified level
 #
+#Multiple report files can be converted at once (in parallel with --threads),
+#either into one mpa-style file per report within an output directory or,
+#with --combine, directly into a combined table (as combine_mpa.py).
+#
 #Methods
 #   - main
-#   - process_kraken_report
+#   - convert_report
+#   (report parsing and conversion: see kreport_convert.py)
 #
 import os, sys, argparse
+import multiprocessing
+from kreport_convert import convert_kreport, mpa_lines, MpaWriter
+from combine_mpa import CombinedMpa
 
-#process_kraken_report
-#usage: parses a single line in the kraken report and extracts relevant information
-#input: kraken report file with the following tab delimited lines
-#   - percent of total reads
-#   - number of reads (including at lower levels)
-#   - number of reads (only at this level)
-#   - taxonomy classification of level
-#       (U, D, P, C, O, F, G, S, -)
-#   - taxonomy ID (0 = unclassified, 1 = root, 2 = Bacteria,...etc)
-#   - spaces + name
-#returns:
-#   - classification/genome name
-#   - level name (U, -, D, P, C, O, F, G, S)
-#   - reads classified at this level and below in the tree
-def process_kraken_report(curr_str, remove_spaces):
-    split_str = curr_str.strip().split('\t')
-    if len(split_str) < 4:
-        return []
-    try:
-        int(split_str[1])
-    except ValueError:
-        return []
-    percents = float(split_str[0])
-    all_reads = int(split_str[1])
-    #Extract relevant information
-    try:
-        taxid = int(split_str[-3]) 
-        level_type = split_str[-2]
-        map_kuniq = {'species':'S', 'genus':'G','family':'F',
-            'order':'O','class':'C','phylum':'P','superkingdom':'D',
-            'kingdom':'K'}
-        if level_type not in map_kuniq:
-            level_type = '-'
-        else:
-            level_type = map_kuniq[level_type]
-    except ValueError:
-        taxid = int(split_str[-2])
-        level_type = split_str[-3]
-    #Get name and spaces 
-    spaces = 0
-    name = split_str[-1]
-    for char in name:
-        if char == ' ':
-            name = name[1:]
-            spaces += 1
-        else:
-            break
-    if remove_spaces == True:
-        name = name.replace(' ','_')
-    #Determine level based on number of spaces
-    level_num = spaces/2
-    return [name, level_num, level_type, all_reads, percents]
+#convert_report
+#usage: converts a single kraken report (run independently for each report, 
+#   possibly in a separate process)
+#input: list of the report filename, output filename (empty to return lines
+#   instead), and the x_include, use_reads, remove_spaces, add_header options 
+#returns: mpa-style lines (if no output filename is given)
+def convert_report(params):
+    [r_file, out_file, x_include, use_reads, remove_spaces, add_header] = params
+    header = ''
+    if add_header:
+        header = os.path.basename(r_file)
+    if out_file == '':
+        return mpa_lines(r_file, x_include, use_reads, remove_spaces, header)
+    o_file = open(out_file, 'w')
+    convert_kreport(r_file, [MpaWriter(o_file, x_include, use_reads, remove_spaces, header)])
+    o_file.close()
+    return []
 
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('-r', '--report-file', '--report', required=True,
-        dest='r_file', help='Input kraken report file for converting')
+        nargs='+', dest='r_files', help='Input kraken report file[s] for converting')
     parser.add_argument('-o', '--output', required=True,
-        dest='o_file', help='Output mpa-report file name')
+        dest='o_file', help='Output mpa-report file name \
+        [output directory if multiple reports are given without --combine]')
+    parser.add_argument('--combine', action='store_true',
+        dest='combine', default=False, required=False,
+        help='Write a single combined mpa-report for all reports (as combine_mpa.py)')
+    parser.add_argument('--threads', required=False, dest='threads',
+        default=1, type=int, help='Number of processes used to convert reports [default: 1]')
     parser.add_argument('--display-header', action='store_true', 
         dest='add_header', default=False, required=False,
         help='Include header [Kraken report filename] in mpa-report file [default: no header]') 
@@ -134,63 +113,46 @@ def main():
     group.add_argument('--keep-spaces', action='store_false',
         dest='remove_spaces', default=False, required=False,
         help='Do not replace space with underscore in taxon name')
-    args=parser.parse_args()
+    args=parser.parse_args(argv)
 
-    #Process report file and output 
-    curr_path = [] 
-    prev_lvl_num = -1
-    r_file = open(args.r_file, 'r')
-    o_file = open(args.o_file, 'w')
-    #Print header
-    if args.add_header:
-        o_file.write("#Classification\t" + os.path.basename(args.r_file) + "\n")
-    
-    #Read through report file 
-    main_lvls = ['R','K','D','P','C','O','F','G','S']
-    for line in r_file:
-        report_vals = process_kraken_report(line, args.remove_spaces)
-        #If header line, skip
-        if len(report_vals) < 5: 
-            continue
-        #Get relevant information from the line 
-        [name, level_num, level_type, all_reads, percents] = report_vals
-        if level_type == 'U':
-            continue
-        #Create level name 
-        if level_type not in main_lvls:
-            level_type = "x"
-        elif level_type == "K":
-            level_type = "k"
-        elif level_type == "D":
-            level_type = "d"
-        level_str = level_type.lower() + "__" + name
-        #Determine full string to add
-        if prev_lvl_num == -1:
-            #First level
-            prev_lvl_num = level_num
-            curr_path.append(level_str)
-        else:
-            #Move back if needed
-            while level_num != (prev_lvl_num + 1):
-                prev_lvl_num -= 1
-                curr_path.pop()
-            #Print if at non-traditional level and that is requested
-            if (level_type == "x" and args.x_include) or level_type != "x":
-                #Print all ancestors of current level followed by |
-                for string in curr_path:
-                    if (string[0] == "x" and args.x_include) or string[0] != "x":
-                        if string[0] != "r": 
-                            o_file.write(string + "|")
-                #Print final level and then number of reads
-                if args.use_reads:
-                    o_file.write(level_str + "\t" + str(all_reads) + "\n")
-                else:
-                    o_file.write(level_str + "\t" + str(percents) + "\n")
-            #Update
-            curr_path.append(level_str)
-            prev_lvl_num = level_num
-    o_file.close()
-    r_file.close()
+    #Determine output file for each report
+    if args.combine:
+        out_files = ['']*len(args.r_files)
+    elif len(args.r_files) == 1:
+        out_files = [args.o_file]
+    else:
+        out_files = [os.path.join(args.o_file, os.path.basename(r_file) + '.mpa') for r_file in args.r_files]
+        #Reports with the same filename would be written to the same output
+        out2report = {}
+        for [r_file, out_file] in zip(args.r_files, out_files):
+            if out_file in out2report:
+                sys.stderr.write("Reports %s and %s would both be written to %s\n" % (out2report[out_file], r_file, out_file))
+                sys.stderr.write("Please rename the reports or use --combine\n")
+                sys.exit(1)
+            out2report[out_file] = r_file
+        if not os.path.isdir(args.o_file):
+            os.makedirs(args.o_file)
+    params = [[args.r_files[i], out_files[i], args.x_include, args.use_reads, 
+        args.remove_spaces, args.add_header] for i in range(len(args.r_files))]
+
+    #Process report files and output 
+    if args.threads > 1:
+        pool = multiprocessing.Pool(args.threads)
+        reports = pool.imap(convert_report, params)
+    else:
+        pool = None
+        reports = map(convert_report, params)
+    combined = CombinedMpa()
+    for lines in reports:
+        if args.combine:
+            combined.add_sample(lines)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if args.combine:
+        o_file = open(args.o_file, 'w')
+        combined.write(o_file)
+        o_file.close()
 
 if __name__ == "__main__":
     main()
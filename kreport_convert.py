@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+####################################################################
+#kreport_convert.py converts a Kraken-style report into one or more
+#flat formats (mpa [MetaPhlAn], Krona text) in a single pass
+#Copyright (C) 2017-2020 Jennifer Lu, jennifer.lu717@gmail.com
+
+#This file is part of KrakenTools.
+#KrakenTools is free software; you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation; either version 3 of the license, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+####################################################################
+#Jennifer Lu, jlu26@jhmi.edu
+#
+#This program reads in a Kraken report file once and writes each of the
+#requested output formats while reading. It is used by kreport2mpa.py
+#and kreport2krona.py, and can be run directly to generate several
+#formats from the same report.
+#
+#Parameters:
+#   -h, --help...............show help message
+#   -r X, --report-file X....input kraken report filename
+#   --mpa X..................output mpa-style text filename
+#   --krona X................output Krona text filename
+#   --krona-html X...........output Krona HTML chart filename
+#   --intermediate-ranks.....include non-traditional taxonomic ranks
+#   --no-intermediate-ranks..do not include non-traditional ranks [default]
+#   --display-header.........include header in mpa-style output
+#   --percentages............use percentages in mpa-style output [instead of reads]
+#   --keep-spaces............do not replace spaces in mpa-style output taxon names
+#Input file format (tab-delimited)
+#   - percentage of total reads
+#   - number of reads (including reads within subtree)
+#   - number of reads (only at this level)
+#   - taxonomic classification of level (U, D, P, C, O, F, G, S,...etc)
+#   - NCBI taxonomic ID
+#   - name of level
+#
+#Methods
+#   - main
+#   - process_kraken_report
+#   - convert_kreport
+#   - mpa_lines
+#   - krona_lines
+#Classes (one per output format)
+#   - MpaWriter
+#   - KronaWriter
+#   - KronaChartWriter (adds to a KronaChart, written as Krona HTML)
+####################################################################
+import os, sys, argparse
+import io
+from xml.sax.saxutils import escape, quoteattr
+
+####################################################################
+#process_kraken_report
+#usage: parses a single line in the kraken report and extracts relevant information
+#input: kraken report file with the following tab delimited lines
+#   - percent of total reads
+#   - number of reads (including at lower levels)
+#   - number of reads (only at this level)
+#   - taxonomy classification of level
+#       (U, D, P, C, O, F, G, S, -)
+#   - taxonomy ID (0 = unclassified, 1 = root, 2 = Bacteria,...etc)
+#   - spaces + name
+#returns:
+#   - classification/genome name
+#   - level number (number of spaces before name / 2)
+#   - level name (U, -, D, P, C, O, F, G, S)
+#   - reads classified at this level and below in the tree
+#   - reads classified only at this level
+#   - percent of total reads
+def process_kraken_report(curr_str):
+    split_str = curr_str.strip().split('\t')
+    if len(split_str) < 4:
+        return []
+    try:
+        int(split_str[1])
+    except ValueError:
+        return []
+    percents = float(split_str[0])
+    all_reads = int(split_str[1])
+    lvl_reads = int(split_str[2])
+    #Extract relevant information
+    try:
+        taxid = int(split_str[-3])
+        level_type = split_str[-2]
+        map_kuniq = {'species':'S', 'genus':'G','family':'F',
+            'order':'O','class':'C','phylum':'P','superkingdom':'D',
+            'kingdom':'K'}
+        if level_type not in map_kuniq:
+            level_type = '-'
+        else:
+            level_type = map_kuniq[level_type]
+    except ValueError:
+        taxid = int(split_str[-2])
+        level_type = split_str[-3]
+    #Get name and spaces
+    spaces = 0
+    name = split_str[-1]
+    for char in name:
+        if char == ' ':
+            name = name[1:]
+            spaces += 1
+        else:
+            break
+    #Determine level based on number of spaces
+    level_num = spaces/2
+    return [name, level_num, level_type, all_reads, lvl_reads, percents]
+
+####################################################################
+#MpaWriter
+#usage: writes an mpa-style (MetaPhlAn) report. Each line lists the
+#   |-delimited levels leading up to a taxon [d,k,p,c,o,f,g,s,x]
+#   and the reads (or percentage) within that taxon's subtree
+class MpaWriter(object):
+    'mpa-style output.'
+    main_lvls = ['R','K','D','P','C','O','F','G','S']
+    def __init__(self, o_file, x_include=False, use_reads=True, remove_spaces=True, header=''):
+        self.o_file = o_file
+        self.x_include = x_include
+        self.use_reads = use_reads
+        self.remove_spaces = remove_spaces
+        #prefixes[i] = ancestors (already filtered and |-joined) of a level at depth i
+        self.prefixes = [""]
+        self.lines = []
+        if header != '':
+            self.o_file.write("#Classification\t" + header + "\n")
+    def unclassified(self, lvl_reads):
+        return
+    def add(self, depth, name, level_type, all_reads, lvl_reads, percents):
+        if self.remove_spaces:
+            name = name.replace(' ','_')
+        #Create level name
+        if level_type not in self.main_lvls:
+            level_type = "x"
+        elif level_type == "K":
+            level_type = "k"
+        elif level_type == "D":
+            level_type = "d"
+        level_str = level_type.lower() + "__" + name
+        prefix = self.prefixes[depth]
+        del self.prefixes[depth+1:]
+        #Print if at non-traditional level and that is requested
+        #   (the first level is never printed)
+        printed = level_type != "x" or self.x_include
+        if depth > 0 and printed:
+            #Print ancestors of current level, final level and then number of reads
+            if self.use_reads:
+                self.lines.append(prefix + level_str + "\t" + str(all_reads) + "\n")
+            else:
+                self.lines.append(prefix + level_str + "\t" + str(percents) + "\n")
+            if len(self.lines) >= 10000:
+                self.flush()
+        #Save path for all children of this level
+        if printed and level_str[0] != "r":
+            prefix += level_str + "|"
+        self.prefixes.append(prefix)
+    def flush(self):
+        self.o_file.writelines(self.lines)
+        self.lines = []
+    def close(self):
+        self.flush()
+
+####################################################################
+#KronaWriter
+#usage: writes a Krona-compatible text report (for ktImportText). Each line
+#   has the reads at a taxon followed by the tab-delimited levels leading
+#   up to that taxon [k,p,c,o,f,g,s,x]
+#   Without intermediate ranks, reads at non-traditional levels are added
+#   to the closest traditional ancestor, and each line is printed once all
+#   levels below it are read (i.e. after the lines of its descendants)
+class KronaWriter(object):
+    'Krona text output.'
+    main_lvls = ['D','P','C','O','F','G','S']
+    def __init__(self, o_file, x_include=False):
+        self.o_file = o_file
+        self.x_include = x_include
+        #prefixes[i] = tab-delimited ancestors of a level at depth i
+        self.prefixes = [""]
+        #levels[i] = [reads, tab-delimited path (empty if not traditional),
+        #   tab-delimited traditional ancestors of its children] for the
+        #   level at depth i whose subtree is still being read
+        self.levels = []
+    def unclassified(self, lvl_reads):
+        self.emit(lvl_reads, "\tUnclassified")
+    #emit
+    #usage: outputs one line [reads, then the tab-delimited path to the level]
+    def emit(self, reads, path):
+        self.o_file.write("%i%s\n" % (reads, path))
+    def add(self, depth, name, level_type, all_reads, lvl_reads, percents):
+        name = name.replace(' ','_')
+        #Create level name
+        if level_type not in self.main_lvls:
+            level_type = "x"
+        elif level_type == "D":
+            level_type = "K"
+        level_str = level_type.lower() + "__" + name
+        if self.x_include:
+            #Print all ancestors of current level followed by this level
+            prefix = self.prefixes[depth]
+            del self.prefixes[depth+1:]
+            self.emit(lvl_reads, prefix + "\t" + level_str)
+            self.prefixes.append(prefix + "\t" + level_str)
+            return
+        #Print levels whose subtrees are complete
+        self.close_levels(depth)
+        prefix = ""
+        if depth > 0:
+            prefix = self.levels[-1][2]
+        if level_type == "x":
+            #IF AT NON-TRADITIONAL LEVEL, ADD TO CLOSEST TRADITIONAL ANCESTOR
+            for level in reversed(self.levels):
+                if level[1] != "":
+                    level[0] += lvl_reads
+                    break
+            self.levels.append([0, "", prefix])
+        else:
+            #IF AT TRADITIONAL LEVEL, SAVE UNTIL ITS SUBTREE IS COMPLETE
+            path = prefix + "\t" + level_str
+            self.levels.append([lvl_reads, path, path])
+    #close_levels
+    #usage: prints all traditional levels at the given depth or deeper
+    def close_levels(self, depth):
+        while len(self.levels) > depth:
+            [reads, path, prefix] = self.levels.pop()
+            if path != "":
+                self.emit(reads, path)
+    def close(self):
+        self.close_levels(0)
+
+####################################################################
+#KronaChart
+#usage: Krona chart for one or more samples (datasets). Lines from each
+#   sample's KronaChartWriter are merged into one tree, which is then
+#   written as a Krona HTML file (no ktImportText needed)
+class KronaChart(object):
+    'Krona chart.'
+    def __init__(self, datasets, url="https://krona.sourceforge.net"):
+        self.datasets = datasets
+        self.url = url
+        #node = [children (name -> node), reads at this node per dataset]
+        self.root = [{}, [0]*len(datasets)]
+    #add
+    #usage: adds reads for one dataset at the end of a path of level names
+    def add(self, dataset, reads, path):
+        node = self.root
+        for name in path:
+            if name not in node[0]:
+                node[0][name] = [{}, [0]*len(self.datasets)]
+            node = node[0][name]
+        node[1][dataset] += reads
+    #magnitudes
+    #usage: sums the reads within each subtree (saved as node[2])
+    def magnitudes(self, node):
+        total = list(node[1])
+        for child in node[0].values():
+            for [i, reads] in enumerate(self.magnitudes(child)):
+                total[i] += reads
+        node[2:] = [total]
+        return total
+    #write
+    #usage: writes the HTML file, streaming one XML node element at a time
+    def write(self, o_file, root_name="all"):
+        self.magnitudes(self.root)
+        url = self.url
+        o_file.write('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+            '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n'
+            ' <head>\n  <meta charset="utf-8"/>\n'
+            '  <link rel="shortcut icon" href="%s/img/favicon.ico"/>\n'
+            '  <script id="notfound">window.onload=function(){document.body.innerHTML='
+            '"Could not get resources from \\"%s\\"."}</script>\n'
+            '  <script src="%s/src/krona-2.0.js"></script>\n </head>\n <body>\n'
+            '  <img id="hiddenImage" src="%s/img/hidden.png" style="display:none"/>\n'
+            '  <img id="loadingImage" src="%s/img/loading.gif" style="display:none"/>\n'
+            '  <noscript>Javascript must be enabled to view this page.</noscript>\n'
+            '  <div style="display:none">\n  <krona collapse="true" key="true">\n'
+            '   <attributes magnitude="magnitude">\n'
+            '    <attribute display="Total">magnitude</attribute>\n   </attributes>\n'
+            '   <datasets>\n' % (url, url, url, url, url))
+        for name in self.datasets:
+            o_file.write('    <dataset>%s</dataset>\n' % escape(name))
+        o_file.write('   </datasets>\n')
+        #Depth-first, closing each node after its children
+        todo = [[root_name, self.root]]
+        while len(todo) > 0:
+            [name, node] = todo.pop()
+            if node is None:
+                o_file.write('</node>\n')
+                continue
+            o_file.write('<node name=%s><magnitude>%s</magnitude>\n' % (quoteattr(name),
+                "".join(["<val>%i</val>" % reads for reads in node[2]])))
+            todo.append([name, None])
+            todo.extend(reversed(list(node[0].items())))
+        o_file.write('  </krona>\n  </div>\n </body>\n</html>\n')
+
+####################################################################
+#KronaChartWriter
+#usage: adds the Krona lines of one report to a dataset of a KronaChart
+class KronaChartWriter(KronaWriter):
+    'Krona chart output.'
+    def __init__(self, chart, dataset, x_include=False):
+        KronaWriter.__init__(self, None, x_include)
+        self.chart = chart
+        self.dataset = dataset
+    def emit(self, reads, path):
+        self.chart.add(self.dataset, reads, path.split("\t")[1:])
+
+####################################################################
+#convert_kreport
+#usage: reads a kraken report once, passing each line to every writer
+#   along with its depth in the tree (the position of the level in
+#   the path of levels leading up to it)
+#input:
+#   - kraken report filename (or kraken report lines, e.g. from make_kreport.py)
+#   - list of writers (MpaWriter, KronaWriter)
+#returns: none
+def convert_kreport(report_file, writers):
+    level_nums = []
+    if isinstance(report_file, str):
+        r_file = open(report_file, 'r')
+    else:
+        r_file = report_file
+    for line in r_file:
+        report_vals = process_kraken_report(line)
+        #If header line, skip
+        if len(report_vals) < 6:
+            continue
+        #Get relevant information from the line
+        [name, level_num, level_type, all_reads, lvl_reads, percents] = report_vals
+        if level_type == 'U':
+            for writer in writers:
+                writer.unclassified(lvl_reads)
+            continue
+        #Move back if needed
+        while len(level_nums) > 0 and level_num != (level_nums[-1] + 1):
+            level_nums.pop()
+        depth = len(level_nums)
+        level_nums.append(level_num)
+        for writer in writers:
+            writer.add(depth, name, level_type, all_reads, lvl_reads, percents)
+    if r_file is not report_file:
+        r_file.close()
+    for writer in writers:
+        writer.close()
+
+####################################################################
+#mpa_lines
+#usage: converts a kraken report to mpa-style lines in memory
+#input: kraken report filename or lines, and the MpaWriter options
+#returns: list of mpa-style lines
+def mpa_lines(report_file, x_include=False, use_reads=True, remove_spaces=True, header=''):
+    o_file = io.StringIO()
+    convert_kreport(report_file, [MpaWriter(o_file, x_include, use_reads, remove_spaces, header)])
+    return o_file.getvalue().splitlines(True)
+
+####################################################################
+#krona_lines
+#usage: converts a kraken report to Krona text lines in memory
+#input: kraken report filename or lines, and the KronaWriter options
+#returns: list of Krona text lines
+def krona_lines(report_file, x_include=False):
+    o_file = io.StringIO()
+    convert_kreport(report_file, [KronaWriter(o_file, x_include)])
+    return o_file.getvalue().splitlines(True)
+
+####################################################################
+#Main method
+def main(argv=None):
+    #Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--report-file', '--report', required=True,
+        dest='r_file', help='Input kraken report file for converting')
+    parser.add_argument('--mpa', required=False, default='',
+        dest='mpa_file', help='Output mpa-report file name')
+    parser.add_argument('--krona', required=False, default='',
+        dest='krona_file', help='Output krona-report file name')
+    parser.add_argument('--krona-html', required=False, default='',
+        dest='html_file', help='Output Krona HTML chart file name')
+    parser.add_argument('--intermediate-ranks', action='store_true',
+        dest='x_include', default=False, required=False,
+        help='Include non-traditional taxonomic ranks in output')
+    parser.add_argument('--no-intermediate-ranks', action='store_false',
+        dest='x_include', default=False, required=False,
+        help='Do not include non-traditional taxonomic ranks in output [default]')
+    parser.add_argument('--display-header', action='store_true',
+        dest='add_header', default=False, required=False,
+        help='Include header [Kraken report filename] in mpa-report file [default: no header]')
+    parser.add_argument('--percentages', action='store_false',
+        dest='use_reads', default=True, required=False,
+        help='Use percentages for mpa-report output [instead of reads]')
+    parser.add_argument('--keep-spaces', action='store_false',
+        dest='remove_spaces', default=True, required=False,
+        help='Do not replace space with underscore in mpa-report taxon names')
+    args=parser.parse_args(argv)
+
+    if args.mpa_file == '' and args.krona_file == '' and args.html_file == '':
+        sys.stderr.write("Please specify at least one output (--mpa, --krona, --krona-html)\n")
+        sys.exit(1)
+    #Open all outputs
+    o_files = []
+    writers = []
+    if args.mpa_file != '':
+        o_files.append(open(args.mpa_file, 'w'))
+        header = ''
+        if args.add_header:
+            header = os.path.basename(args.r_file)
+        writers.append(MpaWriter(o_files[-1], args.x_include, args.use_reads, args.remove_spaces, header))
+    if args.krona_file != '':
+        o_files.append(open(args.krona_file, 'w'))
+        writers.append(KronaWriter(o_files[-1], args.x_include))
+    if args.html_file != '':
+        chart = KronaChart([os.path.basename(args.r_file)])
+        writers.append(KronaChartWriter(chart, 0, args.x_include))
+    #Read report once for all outputs
+    convert_kreport(args.r_file, writers)
+    if args.html_file != '':
+        o_files.append(open(args.html_file, 'w'))
+        chart.write(o_files[-1])
+    for o_file in o_files:
+        o_file.close()
+
+#################################################################
+if __name__ == "__main__":
+    main()
+#########################END OF PROGRAM##########################
@@ -25,17 +25,31 @@
 #This program creates the kraken report file from
 #the make_ktaxonomy.py output and the kraken output file
 #
+#The report can also be made in memory (see make_kreport), e.g. from
+#the kraken output lines of another program
+#
 #Required Parameters:
 #   -i,-k,--kraken X....................kraken output file
 #   -t,--taxonomy X.....................taxonomy file 
 #   -o, --output X......................output kraken report file 
 #Optional Parameters:
 #   -h, --help..........................show help message.
+#Methods
+#   - main
+#   - read_taxonomy
+#   - taxonomy_tree
+#   - count_reads
+#   - report_lines
+#   - make_kreport
+#Classes
+#   - Tree
+#   - Progress
 #################################################################################
 import os, sys, argparse
 import operator
 from time import gmtime
 from time import strftime 
+import kraken_cache
 #################################################################################
 #Tree Class
 #usage: tree node used in constructing taxonomy tree
@@ -59,39 +73,21 @@ class Tree(object):
         assert isinstance(node,Tree)
         self.children.append(node)
 #################################################################################
-#Main method
-def main():
-    #Parse arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i','--input', '-k','--kraken', dest='kraken_file', required=True,
-        help='Kraken output file (5 tab-delimited columns, taxid in 3rd column)')
-    parser.add_argument('-t','--taxonomy', dest='tax_file', required=True,
-        help='Output taxonomy file from make_ktaxonomy.py')
-    parser.add_argument('-o','--output',dest='out_file', required=True,
-        help='Output kraken report file')
-    parser.add_argument('--use-read-len',dest='use_read_len',
-        action='store_true',default=False, required=False,
-        help='Make report file using sum of read lengths [default: read counts]')
-    args = parser.parse_args()
-
-    #Start Program
-    time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
-    sys.stdout.write("PROGRAM START TIME: " + time + '\n')
-
-    #STEP 1/4: READ TAXONOMY FILE  
-    count_nodes = 0
-    sys.stdout.write(">> STEP 1/4: Reading taxonomy %s...\n" % args.tax_file)
-    sys.stdout.write("\t%i nodes saved" % (count_nodes))
-    #Parse taxonomy file 
+#read_taxonomy
+#usage: parses the make_ktaxonomy.py output into a taxonomy tree (once per
+#   file, shared with other programs in the same process: see kraken_cache.py)
+#input: taxonomy filename
+#returns: 
+#   - root node of the taxonomy tree
+#   - dictionary of taxid to tree node
+def read_taxonomy(tax_file):
+    return kraken_cache.load(tax_file, 'taxonomy tree', taxonomy_tree)
+def taxonomy_tree(tax_file):
+    [taxid2parent, taxid2rank, taxid2depth, taxid2name] = kraken_cache.read_taxonomy(tax_file)
     root_node = -1
     taxid2node = {}
-    t_file = open(args.tax_file,'r')
-    for line in t_file:
-        count_nodes += 1
-        sys.stdout.write("\r\t%i nodes saved" % (count_nodes))
-        sys.stdout.flush()
-        [taxid, p_tid, rank, lvl_num, name] = line.strip().split('\t|\t')
-        curr_node = Tree(taxid, name, rank, lvl_num, p_tid)
+    for [taxid, p_tid] in taxid2parent.items():
+        curr_node = Tree(taxid, taxid2name[taxid], taxid2rank[taxid], taxid2depth[taxid], p_tid)
         taxid2node[taxid] = curr_node
         #set parent/kids
         if taxid == "1":
@@ -99,54 +95,54 @@ def main():
         else:
             curr_node.parent = taxid2node[p_tid]
             taxid2node[p_tid].add_child(curr_node)
-    t_file.close()
-    sys.stdout.write("\r\t%i nodes saved\n" % (count_nodes))
-    sys.stdout.flush()
-    #STEP 2/4: READ KRAKEN FILE FOR COUNTS PER TAXID
+    return [root_node, taxid2node]
+#################################################################################
+#count_reads
+#usage: counts the reads (or read lengths) classified at each taxid
+#input: 
+#   - kraken output lines (5 tab-delimited columns, taxid in 3rd column)
+#   - use_read_len: count the sum of read lengths instead of reads
+#returns: 
+#   - dictionary of taxid to reads (or read lengths) classified at that taxid
+#   - number of kraken output lines read
+def count_reads(kraken_lines, use_read_len=False):
     read_count = 0
-    sys.stdout.write(">> STEP 2/4: Reading kraken file %s...\n" % args.kraken_file)
-    sys.stdout.write("\t%i million reads processed" % read_count)
-    sys.stdout.flush()
-    #Save counts per taxid
     taxid2counts = {}
-    taxid2allcounts = {} 
-    k_file = open(args.kraken_file,'r')
-    for line in k_file:
+    for line in kraken_lines:
         read_count += 1
-        if read_count % 1000 == 0:
-            sys.stdout.write('\r\t%0.3f million reads processed' % float(read_count/1000000.))
-            sys.stdout.flush()
         l_vals = line.strip().split('\t')
         taxid = l_vals[2]
         count = 1
         #If using read length instead of read counts
-        if args.use_read_len:
+        if use_read_len:
             if '|' in l_vals[3]:
                 [len1,len2] = l_vals[3].split('|')
                 count = int(len1)+int(len2)
             else:
                 count = int(l_vals[3])
-        #add to dictionaries 
+        #add to dictionary
         if taxid not in taxid2counts:
             taxid2counts[taxid] = count
-            taxid2allcounts[taxid] = count
         else:
             taxid2counts[taxid] += count
-            taxid2allcounts[taxid] += count
-    k_file.close()
-    sys.stdout.write('\r\t%0.3f million reads processed\n' % float(read_count/1000000.))
-    sys.stdout.flush()
-    #STEP 3/4: FOR EVERY TAXID PARSED, ADD UP TOTAL READS
-    sys.stdout.write(">> STEP 3/4: Creating final tree...\n")
+    return [taxid2counts, read_count]
+#################################################################################
+#report_lines
+#usage: generates the kraken report lines for the reads counted at each taxid
+#   (the taxonomy tree is not modified, so it can be reused for other samples)
+#input:
+#   - root node and dictionary of taxid to tree node (from read_taxonomy)
+#   - dictionary of taxid to reads and number of reads (from count_reads)
+#returns: kraken report lines (generator)
+def report_lines(root_node, taxid2node, taxid2counts, read_count):
+    #FOR EVERY TAXID PARSED, ADD UP TOTAL READS
+    taxid2allcounts = dict(taxid2counts)
     for curr_tid in taxid2counts:
         #Skip unclassified
         if curr_tid == '0':
             continue 
         p_node = taxid2node[curr_tid].parent 
         add_counts = taxid2counts[curr_tid] 
-        #Assign reads for node
-        taxid2node[curr_tid].lvl_reads += add_counts 
-        taxid2node[curr_tid].all_reads += add_counts 
         while (p_node != None):
             #Add child reads to parent node 
             p_taxid = p_node.taxid
@@ -154,45 +150,97 @@ def main():
                 taxid2allcounts[p_taxid] = add_counts
             else:
                 taxid2allcounts[p_taxid] += add_counts
-            p_node.all_reads += add_counts
             #Get next parent node
             p_node = p_node.parent
-    #STEP 4/4: PRINT REPORT FILE 
-    sys.stdout.write(">> STEP 4/4: Printing report file to %s...\n" % args.out_file)
-    o_file = open(args.out_file,'w')
-    #Write line for unclassified reads:
+    #Line for unclassified reads:
     if '0'  in taxid2counts:
-        o_file.write("%6.2f\t" % (float(taxid2counts['0'])/float(read_count)*100))
-        o_file.write("%i\t%i\t" % (taxid2counts['0'],taxid2counts['0']))
-        o_file.write('U\t0\tunclassified\n')
+        yield ("%6.2f\t%i\t%i\tU\t0\tunclassified\n" % (float(taxid2counts['0'])/float(read_count)*100,
+            taxid2counts['0'], taxid2counts['0']))
     #Get remaining lines 
     parse_nodes = [root_node]
     while len(parse_nodes) > 0:
-        curr_node = parse_nodes.pop(0)
+        curr_node = parse_nodes.pop()
         curr_tid = curr_node.taxid 
-        #Print information for this level
-        o_file.write("%6.2f\t" % (float(taxid2allcounts[curr_tid])/float(read_count)*100))
-        o_file.write("%i\t" % taxid2allcounts[curr_tid])
-        if curr_tid not in taxid2counts:
-            o_file.write("0\t")
-        else:
-            o_file.write("%i\t" % taxid2counts[curr_tid])
-        o_file.write("%s\t" % curr_node.level_rank)
-        o_file.write("%s\t" % curr_tid)
-        o_file.write(" "*curr_node.level_num*2 + curr_node.name + "\n")
-        #Add children to list
-        for child in sorted(curr_node.children, key=operator.attrgetter('all_reads')):
-            if child.taxid not in taxid2allcounts:
-                continue
-            if taxid2allcounts[child.taxid] == 0:
-                continue
-            #Add to list 
-            parse_nodes.insert(0,child)    
+        #Information for this level
+        yield ("%6.2f\t%i\t%i\t%s\t%s\t%s\n" % (float(taxid2allcounts[curr_tid])/float(read_count)*100,
+            taxid2allcounts[curr_tid], taxid2counts.get(curr_tid, 0), curr_node.level_rank, 
+            curr_tid, " "*curr_node.level_num*2 + curr_node.name))
+        #Add children with reads to list (most reads on top of the stack)
+        children = [child for child in curr_node.children if taxid2allcounts.get(child.taxid, 0) != 0]
+        children.sort(key=lambda child: taxid2allcounts[child.taxid])
+        parse_nodes.extend(children)
+#################################################################################
+#make_kreport
+#usage: makes a kraken report from kraken output lines (in memory)
+#input:
+#   - kraken output lines (e.g. an open kraken output file)
+#   - taxonomy [root node, dictionary of taxid to tree node] (from read_taxonomy)
+#   - use_read_len: count the sum of read lengths instead of reads
+#returns: kraken report lines (generator)
+def make_kreport(kraken_lines, taxonomy, use_read_len=False):
+    [taxid2counts, read_count] = count_reads(kraken_lines, use_read_len)
+    return report_lines(taxonomy[0], taxonomy[1], taxid2counts, read_count)
+#################################################################################
+#Progress Class
+#usage: passes through the lines of a file, updating the user every 1000 lines
+class Progress(object):
+    'Progress of reading lines.'
+    def __init__(self, lines):
+        self.lines = lines
+        self.count = 0
+    def __iter__(self):
+        for line in self.lines:
+            self.count += 1
+            if self.count % 1000 == 0:
+                sys.stdout.write('\r\t%0.3f million reads processed' % float(self.count/1000000.))
+                sys.stdout.flush()
+            yield line
+#################################################################################
+#Main method
+def main(argv=None):
+    #Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i','--input', '-k','--kraken', dest='kraken_file', required=True,
+        help='Kraken output file (5 tab-delimited columns, taxid in 3rd column)')
+    parser.add_argument('-t','--taxonomy', dest='tax_file', required=True,
+        help='Output taxonomy file from make_ktaxonomy.py')
+    parser.add_argument('-o','--output',dest='out_file', required=True,
+        help='Output kraken report file')
+    parser.add_argument('--use-read-len',dest='use_read_len',
+        action='store_true',default=False, required=False,
+        help='Make report file using sum of read lengths [default: read counts]')
+    args = parser.parse_args(argv)
+
+    #Start Program
+    time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
+    sys.stdout.write("PROGRAM START TIME: " + time + '\n')
+
+    #STEP 1/4: READ TAXONOMY FILE  
+    sys.stdout.write(">> STEP 1/4: Reading taxonomy %s...\n" % args.tax_file)
+    [root_node, taxid2node] = read_taxonomy(args.tax_file)
+    sys.stdout.write("\t%i nodes saved\n" % len(taxid2node))
+    sys.stdout.flush()
+    #STEP 2/4: READ KRAKEN FILE FOR COUNTS PER TAXID
+    sys.stdout.write(">> STEP 2/4: Reading kraken file %s...\n" % args.kraken_file)
+    sys.stdout.write("\t%i million reads processed" % 0)
+    sys.stdout.flush()
+    k_file = open(args.kraken_file,'r')
+    k_lines = Progress(k_file)
+    [taxid2counts, read_count] = count_reads(k_lines, args.use_read_len)
+    k_file.close()
+    sys.stdout.write('\r\t%0.3f million reads processed\n' % float(read_count/1000000.))
+    sys.stdout.flush()
+    #STEP 3/4: FOR EVERY TAXID PARSED, ADD UP TOTAL READS
+    sys.stdout.write(">> STEP 3/4: Creating final tree...\n")
+    lines = report_lines(root_node, taxid2node, taxid2counts, read_count)
+    #STEP 4/4: PRINT REPORT FILE 
+    sys.stdout.write(">> STEP 4/4: Printing report file to %s...\n" % args.out_file)
+    o_file = open(args.out_file,'w')
+    o_file.writelines(lines)
     o_file.close() 
     #End of program
     time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
     sys.stdout.write("PROGRAM END TIME: " + time + '\n')
-    sys.exit(0)
 
 #################################################################################
 if __name__ == "__main__":
@@ -60,7 +60,7 @@ class Tree(object):
         self.children.append(node)
 #################################################################################
 #Main method
-def main():
+def main(argv=None):
     #Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('--nodes',dest='nodes_file', required=True,
@@ -71,7 +71,7 @@ def main():
         help='seqid2taxid.map file')
     parser.add_argument('-o','--output',dest='out_file', required=True,
         help='output taxonomy file')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     #Start Program
     time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
@@ -243,7 +243,6 @@ def main():
     #End of program
     time = strftime("%m-%d-%Y %H:%M:%S", gmtime())
     sys.stdout.write("PROGRAM END TIME: " + time + '\n')
-    sys.exit(0)
 
 #################################################################################
 if __name__ == "__main__":
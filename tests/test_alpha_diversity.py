@@ -0,0 +1,73 @@
+import os, sys, warnings
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'DiversityTools'))
+import combine_kreports
+import alpha_diversity
+
+#Kraken reports: [reads at each species (taxids 10, 11, 12)]
+REPORTS = [[50, 30, 20], [10, 0, 90]]
+
+def write_report(filename, species):
+    total = sum(species)
+    r_file = open(filename, 'w')
+    r_file.write("%6.2f\t%i\t%i\tR\t1\troot\n" % (100.0, total, 0))
+    r_file.write("%6.2f\t%i\t%i\tG\t2\t  G\n" % (100.0, total, 0))
+    for [i, reads] in enumerate(species):
+        if reads > 0:
+            r_file.write("%6.2f\t%i\t%i\tS\t%i\t    S%i\n" % (100.0*reads/total, reads, reads, 10+i, i))
+    r_file.close()
+
+def combine(tmp_path, options):
+    r_files = []
+    for [i, species] in enumerate(REPORTS):
+        r_files.append(str(tmp_path / ("r%i.kreport" % i)))
+        write_report(r_files[-1], species)
+    out_file = str(tmp_path / "combined.txt")
+    combine_kreports.main(['-r'] + r_files + ['-o', out_file] + options)
+    return out_file
+
+@pytest.mark.parametrize('options', [[], ['--no-headers']])
+def test_combined_samples(tmp_path, options):
+    out_file = combine(tmp_path, options)
+    [names, taxa, n] = alpha_diversity.read_samples([out_file], 'combined', 'S')
+    assert len(names) == 2
+    expected = alpha_diversity.alpha_diversity(np.array(REPORTS, dtype=float))
+    values = alpha_diversity.alpha_diversity(n)
+    cols = [taxa.index(str(10+i)) for i in range(3)]
+    assert np.allclose(n[:, cols], REPORTS)
+    assert np.allclose(values['Sh'], expected['Sh'])
+
+@pytest.mark.parametrize('options', [['--only-combined'], ['--only-combined', '--no-headers']])
+def test_only_combined(tmp_path, options):
+    out_file = combine(tmp_path, options)
+    [names, taxa, n] = alpha_diversity.read_samples([out_file], 'combined', 'S')
+    assert names == [out_file]
+    total = np.sum(REPORTS, axis=0)
+    cols = [taxa.index(str(10+i)) for i in range(3)]
+    assert np.allclose(n[0, cols], total)
+    values = alpha_diversity.alpha_diversity(n)
+    assert np.allclose(values['Sh'], alpha_diversity.alpha_diversity(total)['Sh'])
+
+def test_rarefaction_no_warnings():
+    #Fisher's alpha is infinite when every subsampled read is a new species
+    n = np.array([[1, 1, 1, 1, 1, 1, 1, 1], [5, 0, 3, 0, 0, 1, 1, 1]])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        [means, sds, observed] = alpha_diversity.rarefaction(n, [2, 4, 8], iterations=5)
+    assert np.isinf(means['F'][0]).all()
+    assert np.allclose(observed[0], [2, 4, 8])
+
+@pytest.mark.parametrize('header', ["", "#perc\ttot_all\ttot_lvl\tlvl_type\ttaxid\tname\n",
+    "#perc\ttot_all\ttot_lvl\tS1_all\tS1_lvl\tS2_all\tS2_lvl\tlvl_type\ttaxid\tname\n"])
+def test_empty_combined(tmp_path, header):
+    out_file = str(tmp_path / "combined.txt")
+    o_file = open(out_file, 'w')
+    o_file.write(header)
+    o_file.close()
+    with pytest.raises(SystemExit) as e:
+        alpha_diversity.read_samples([out_file], 'combined', 'S')
+    assert e.value.code == 1
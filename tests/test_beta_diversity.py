@@ -0,0 +1,21 @@
+import os, sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'DiversityTools'))
+import beta_diversity
+
+def full_eigvals(bc, axes):
+    n = bc.shape[0]
+    j = np.eye(n) - 1.0/n
+    return np.sort(np.linalg.eigvalsh(-0.5*j.dot(bc*bc).dot(j)))[::-1][:axes]
+
+def test_pcoa_converges():
+    #Samples without structure: top eigenvalues are close together
+    x = np.random.default_rng(1).random((400, 50))
+    bc = np.sqrt(((x[:, None, :] - x[None, :, :])**2).sum(axis=2))
+    expected = full_eigvals(bc, 3)
+    for full_size in [1000, 0]:
+        [coords, eigvals, explained] = beta_diversity.pcoa(bc, 3, full_size=full_size)
+        assert np.allclose(eigvals, expected, rtol=1e-4)
+        assert np.allclose(np.sum(coords*coords, axis=0), eigvals, rtol=1e-4)
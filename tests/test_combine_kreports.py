@@ -0,0 +1,50 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import combine_kreports
+
+#Kraken reports: [reads at each species (taxids 10, 11, 12)]
+REPORTS = [[50, 30, 20], [10, 0, 90], [5, 5, 5]]
+
+def write_report(filename, species):
+    total = sum(species)
+    r_file = open(filename, 'w')
+    r_file.write("%6.2f\t%i\t%i\tR\t1\troot\n" % (100.0, total, 0))
+    r_file.write("%6.2f\t%i\t%i\tG\t2\t  G\n" % (100.0, total, 0))
+    for [i, reads] in enumerate(species):
+        if reads > 0:
+            r_file.write("%6.2f\t%i\t%i\tS\t%i\t    S%i\n" % (100.0*reads/total, reads, reads, 10+i, i))
+    r_file.close()
+
+def write_reports(tmp_path):
+    r_files = []
+    for [i, species] in enumerate(REPORTS):
+        r_files.append(str(tmp_path / ("r%i.kreport" % i)))
+        write_report(r_files[-1], species)
+    return r_files
+
+def data_lines(filename):
+    return [line for line in open(filename) if line[0] != '#']
+
+def test_recombine_no_headers(tmp_path):
+    r_files = write_reports(tmp_path)
+    group_file = str(tmp_path / "group.txt")
+    combine_kreports.main(['-r'] + r_files[0:2] + ['-o', group_file, '--no-headers'])
+    out_file = str(tmp_path / "out.txt")
+    combine_kreports.main(['-r', group_file, r_files[2], '-o', out_file])
+    all_file = str(tmp_path / "all.txt")
+    combine_kreports.main(['-r'] + r_files + ['-o', all_file])
+    #Each sample column of the group report is kept as its own sample
+    assert data_lines(out_file) == data_lines(all_file)
+
+def test_unique_names(tmp_path):
+    r_files = write_reports(tmp_path)
+    group1 = str(tmp_path / "group1.txt")
+    combine_kreports.main(['-r'] + r_files[0:2] + ['-o', group1, '--sample-names', 'S3', 'X'])
+    group2 = str(tmp_path / "group2.txt")
+    combine_kreports.main(['-r'] + r_files[1:3] + ['-o', group2])
+    combined = combine_kreports.combine_reports([group1, group2])
+    names = combined.names()
+    assert len(set(names)) == 4
+    assert names[0:2] == ['S3', 'X']
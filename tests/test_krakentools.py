@@ -0,0 +1,64 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import krakentools
+
+#Taxonomy: [taxid, parent taxid, rank, depth, name]
+TAXONOMY = [['1', '1', 'R', 0, 'root'],
+    ['2', '1', 'D', 1, 'Bacteria'],
+    ['10', '2', 'G', 2, 'Genus A'],
+    ['11', '10', 'S', 3, 'Species A1'],
+    ['12', '10', 'S', 3, 'Species A2']]
+#Kraken output: reads classified at each taxid
+READS = [['0', 2], ['11', 5], ['12', 3], ['10', 1]]
+
+def write_inputs(tmp_path):
+    tax_file = str(tmp_path / "tax.ktax")
+    t_file = open(tax_file, 'w')
+    for [taxid, p_taxid, rank, depth, name] in TAXONOMY:
+        t_file.write("%s\t|\t%s\t|\t%s\t|\t%i\t|\t%s\n" % (taxid, p_taxid, rank, depth, name))
+    t_file.close()
+    kraken_file = str(tmp_path / "a.kraken")
+    k_file = open(kraken_file, 'w')
+    count = 0
+    for [taxid, reads] in READS:
+        for i in range(reads):
+            count += 1
+            k_file.write("%s\tread%i\t%s\t100\t%s:66\n" % ('U' if taxid == '0' else 'C', count, taxid, taxid))
+    k_file.close()
+    return [tax_file, kraken_file]
+
+def test_pipeline(tmp_path):
+    [tax_file, kraken_file] = write_inputs(tmp_path)
+    report_file = str(tmp_path / "pipe.kreport")
+    mpa_file = str(tmp_path / "pipe.mpa")
+    krona_file = str(tmp_path / "pipe.krona")
+    krakentools.main(['make-kreport', '-i', kraken_file, '-t', tax_file, '-o', report_file,
+        '+', 'kreport2mpa', '-r', report_file, '-o', mpa_file,
+        '+', 'kreport2krona', '-r', report_file, '-o', krona_file])
+    mpa = dict([line.strip().split('\t') for line in open(mpa_file)])
+    assert mpa['d__Bacteria'] == '9'
+    assert mpa['d__Bacteria|g__Genus_A|s__Species_A1'] == '5'
+    assert mpa['d__Bacteria|g__Genus_A|s__Species_A2'] == '3'
+    assert os.path.getsize(krona_file) > 0
+
+def test_pipeline_shares_files(tmp_path):
+    [tax_file, kraken_file] = write_inputs(tmp_path)
+    report_file = str(tmp_path / "pipe.kreport")
+    kraken_cache = krakentools.load_program('kraken_cache.py')
+    kraken_cache.clear()
+    krakentools.main(['make-kreport', '-i', kraken_file, '-t', tax_file, '-o', report_file,
+        '+', 'alpha', '-f', report_file, '-t', 'kreport', '-l', 'S',
+        '+', 'beta', '-i', report_file, report_file, '--type', 'kreport', '--level', 'S',
+        '--metric', 'unifrac', '--taxonomy', tax_file])
+    kinds = sorted([kind for [kind, path] in kraken_cache.files])
+    assert kinds == ['kreport', 'taxonomy', 'taxonomy tree']
+    #Files changed on disk are parsed again
+    tree = kraken_cache.load(report_file, 'kreport', lambda f: None)
+    assert tree is not None
+    r_file = open(report_file, 'a')
+    r_file.write("%6.2f\t%i\t%i\tS\t13\t      Species A3\n" % (0.0, 0, 0))
+    r_file.close()
+    assert kraken_cache.load(report_file, 'kreport', lambda f: None) is None
+    kraken_cache.clear()